@@ -1,40 +1,21 @@
 import streamlit as st
 
-import jsonlines
-
 import pandas as pd
 
-# Thresholds as per given data
-
-thresholds = {
-
-    "Blood": 80,
-
-    "Yolk": 120,
-
-    "Feces": 130,
-
-    "Bruised": 20,
-
-    "OpenCrack": 20,
+from app_cache import cached_result, load_upload
+from egg_index import EggIndex
+from label_registry import ENGLISH_LABELS, preset_thresholds
 
-    "Crack": 175,
-
-    "Wrinkle": 6500,
-
-    "Feather": 100,
-
-    "CalciumSpot": 100,
-
-    "Dust": 150,
+# Thresholds as per given data
 
-    "Group_Dirty": 20,
+thresholds = preset_thresholds()
 
-    "Group_Damaged": 20,
+# FN-vs-window curves from the per-label index (cached by upload hash)
 
-    "Group_ShellDeviation": 1000
+@cached_result
+def cached_curves(digest, _eggs):
 
-}
+    return EggIndex(_eggs).window_curves(thresholds)
 
 # Streamlit UI Setup
 
@@ -50,31 +31,13 @@ uploaded_file = st.file_uploader("Upload JSONL File", type="jsonl")
 
 if uploaded_file:
 
-    # Load JSONL file
-
-    data = []
-
-    with jsonlines.Reader(uploaded_file) as reader:
+    # Load JSONL file into the eggs × labels matrix
 
-        for obj in reader:
+    digest, eggs = load_upload(uploaded_file)
 
-            data.append(obj)
+    # DataFrame for analysis (one column per label)
 
-    # DataFrame for analysis
-
-    df = pd.DataFrame(data)
-
-    # Convert list of dictionaries to individual columns
-
-    egg_data = []
-
-    for egg in df[0]:
-
-        egg_dict = {item['Label']: item['Value'] for item in egg}
-
-        egg_data.append(egg_dict)
-
-    egg_df = pd.DataFrame(egg_data)
+    egg_df = pd.DataFrame(eggs.values, columns=ENGLISH_LABELS)
 
     # Display the uploaded data
 
@@ -138,4 +101,18 @@ if uploaded_file:
 
     st.subheader("Eggs Close to Rejection (2% - 10% Below Threshold)")
 
-    st.table(pd.DataFrame.from_dict(close_to_rejection["2%-10%"], orient='index', columns=['Close to Rejection (2%-10%)'])) 
\ No newline at end of file
+    st.table(pd.DataFrame.from_dict(close_to_rejection["2%-10%"], orient='index', columns=['Close to Rejection (2%-10%)']))
+
+    # What-if: FN count for windows from 0.1% to 10% above the thresholds
+
+    st.subheader("FNs vs. Window Size (0.1% - 10% Above Threshold)")
+
+    curves = cached_curves(digest, eggs)
+
+    curve_df = pd.DataFrame(curves["per_label"], index=curves["percentages"])
+
+    curve_df["All labels (any)"] = curves["fns"]
+
+    curve_df.index.name = "Window (%)"
+
+    st.line_chart(curve_df)
@@ -0,0 +1,48 @@
+import hashlib
+import io
+
+import streamlit as st
+
+from day_ingest import ingest_days
+from egg_store import parse_eggs
+
+# ✅ Bounded cache sizes (least recently used entries are evicted first)
+MAX_CACHED_UPLOADS = 32
+MAX_CACHED_RESULTS = 128
+
+
+def content_digest(content):
+    return hashlib.sha256(content).hexdigest()
+
+
+@st.cache_data(max_entries=MAX_CACHED_UPLOADS, show_spinner=False)
+def _parse_upload(digest, _content):
+    # ✅ Keyed by the content hash only; the raw bytes are not hashed again by Streamlit
+    eggs = parse_eggs(io.BytesIO(_content))
+    eggs.source = _content
+    return eggs
+
+
+def load_upload(uploaded_file):
+    # ✅ Parsed EggStore of an upload plus its content hash (parsed once per distinct content)
+    content = uploaded_file.getvalue()
+    digest = content_digest(content)
+    return digest, _parse_upload(digest, content)
+
+
+@st.cache_data(max_entries=MAX_CACHED_UPLOADS, show_spinner=False)
+def _ingest_uploads(digest, _files):
+    return ingest_days(_files)
+
+
+def load_day_uploads(uploaded_files):
+    # ✅ Day files (or zip/tar archives of them) parsed and checked in parallel, in day order
+    #    Cached by the names and content hashes of the whole upload set
+    files = [(uploaded_file.name, uploaded_file.getvalue()) for uploaded_file in uploaded_files]
+    digest = content_digest("\n".join(f"{name}:{content_digest(content)}" for name, content in files).encode())
+    return _ingest_uploads(digest, files)
+
+
+def cached_result(func):
+    # ✅ Cache expensive results (trained thresholds) by their hashable arguments
+    return st.cache_data(max_entries=MAX_CACHED_RESULTS, show_spinner=False)(func)
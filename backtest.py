@@ -0,0 +1,211 @@
+import argparse
+import contextlib
+import csv
+import json
+import multiprocessing
+import os
+import shutil
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+
+from calibration import DEFAULT_CONFIG, RESTARTS, calibrate_day
+from day_ingest import ingest_days, problem_report
+from egg_archive import ArchiveReader, is_archive
+from egg_store import EggStore, SharedEggs, count_fns, deviation_matrix, extract_fns
+from fleet_calibration import machine_days
+from label_registry import CALIBRATED_LABELS, DAILY_CAP, ceilings, compile_profile, preset_thresholds
+from threshold_strategies import frequency_thresholds, max_deviation_thresholds
+
+# ✅ Backtest tables (and the PPO model registries of each run) are written here
+BACKTEST_OUTPUT_DIR = "backtest_results"
+
+
+def fixed_bump(day, day_eggs, thresholds, max_thresholds, config):
+    # ✅ The day-1 step of the calibration loop (+1%), applied every day
+    return {key: round(value * 1.01, 2) for key, value in thresholds.items()}
+
+
+def hold(day, day_eggs, thresholds, max_thresholds, config):
+    # ✅ Baseline: keep the starting thresholds
+    return thresholds
+
+
+def _day_fns(day_eggs, thresholds):
+    # ✅ The day's 1% FNs with their MaxDeviation (largest in-window deviation, as written by extractFN)
+    fns = extract_fns(day_eggs, thresholds, percentage=1.0)
+    deviation = deviation_matrix(fns, thresholds)
+    in_window = (deviation > 0) & (deviation <= 1.0)
+    return EggStore(fns.values, np.where(in_window, deviation, 0).max(axis=1, initial=0).astype(np.float32))
+
+
+def frequency(day, day_eggs, thresholds, max_thresholds, config):
+    return frequency_thresholds(_day_fns(day_eggs, thresholds), thresholds)
+
+
+def max_deviation(day, day_eggs, thresholds, max_thresholds, config):
+    return max_deviation_thresholds(_day_fns(day_eggs, thresholds), thresholds)
+
+
+def sweep(day, day_eggs, thresholds, max_thresholds, config):
+    return calibrate_day(day, day_eggs, thresholds, max_thresholds, {**config, "engine": "sweep"})[0]
+
+
+def ppo(day, day_eggs, thresholds, max_thresholds, config):
+    return calibrate_day(day, day_eggs, thresholds, max_thresholds, {**config, "engine": "ppo"})[0]
+
+
+# ✅ Strategies by name: (day, day eggs, thresholds, ceilings, config) → proposed thresholds for the next day
+STRATEGIES = {
+    "preset": hold,
+    "fixed_bump": fixed_bump,
+    "frequency": frequency,
+    "max_deviation": max_deviation,
+    "sweep": sweep,
+    "ppo": ppo,
+}
+
+# ✅ Strategies whose result depends on the seed (the others run once)
+SEEDED_STRATEGIES = {"ppo"}
+
+
+def apply_rules(proposed, thresholds, max_thresholds, daily_cap=DAILY_CAP):
+    # ✅ Same rules for every strategy: at most daily_cap up per day and never past the ceiling
+    profile = compile_profile(thresholds, max_thresholds, daily_cap)
+    vector = np.array([proposed[label] for label in profile.labels], dtype=np.float64)
+    capped = np.minimum(np.minimum(vector, profile.thresholds + profile.daily_caps), profile.ceilings)
+    return profile.to_dict(np.round(capped, 2))
+
+
+def load_history(sources):
+    # ✅ [(name, EggStore)] in day order from a machine directory, an egg archive, or day files / zip / tar archives
+    if len(sources) == 1 and os.path.isdir(sources[0]):
+        return [(f"day {day}", load_day()) for day, load_day in machine_days(sources[0])]
+    if len(sources) == 1 and is_archive(sources[0]):
+        reader = ArchiveReader(sources[0])
+        return [(f"day {day}", reader.day(day)) for day in reader.days]
+
+    files = []
+    for path in sources:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    days = ingest_days(files)
+    problems = problem_report(days)
+    if problems:
+        raise ValueError("Bad day files:\n" + "\n".join(problems))
+    return [(day["name"], day["eggs"]) for day in days]
+
+
+def replay(strategy, seed, days, thresholds, max_thresholds, config):
+    # ✅ One strategy over the whole history (runs in a pool worker): a row per day with the thresholds in effect
+    #    and the day's FN count under them
+    config = {**config, "base_seed": seed}
+    if strategy in SEEDED_STRATEGIES:
+        # ✅ Fresh registry per run, so warm starts only come from this replay's own earlier days
+        config["registry_dir"] = os.path.join(config["registry_dir"], f"{strategy}_seed{seed}")
+        shutil.rmtree(config["registry_dir"], ignore_errors=True)
+    propose = STRATEGIES[strategy]
+    rows = []
+    for day, (name, shared_day) in enumerate(days, start=1):
+        day_eggs = shared_day.eggs()
+        started = time.time()
+        proposed = propose(day, day_eggs, thresholds, max_thresholds, config)
+        rows.append({
+            "strategy": strategy,
+            "seed": seed,
+            "day": day,
+            "file": name,
+            "fn_count": int(count_fns(day_eggs, thresholds, percentage=1.0)),
+            "seconds": round(time.time() - started, 3),
+            **thresholds,
+        })
+        thresholds = apply_rules(proposed, thresholds, max_thresholds, config["daily_cap"])
+    return rows
+
+
+def backtest(sources, strategies=None, seeds=(0,), thresholds=None, max_thresholds=None, config=None,
+             workers=None, output_dir=BACKTEST_OUTPUT_DIR):
+    # ✅ Every (strategy, seed) run replays the same days in parallel; returns the rows of one long table
+    strategies = list(strategies or STRATEGIES)
+    thresholds = thresholds or preset_thresholds(CALIBRATED_LABELS)
+    max_thresholds = max_thresholds or ceilings(thresholds)
+    runs = [(strategy, seed) for strategy in strategies
+            for seed in (seeds if strategy in SEEDED_STRATEGIES else seeds[:1])]
+    # ✅ Slowest runs first so they don't end up alone at the tail of the pool
+    runs.sort(key=lambda run: run[0] not in SEEDED_STRATEGIES)
+    workers = workers or min(len(runs), os.cpu_count() or 1) or 1
+
+    # ✅ PPO restarts share the cores left per run; FN batch files are not needed for a replay
+    config = {**DEFAULT_CONFIG, **(config or {}), "save_fn_batch": False}
+    config["registry_dir"] = os.path.abspath(os.path.join(output_dir, "models"))
+    if config["restart_workers"] is None:
+        config["restart_workers"] = max(1, min(RESTARTS, (os.cpu_count() or 1) // workers))
+
+    os.makedirs(output_dir, exist_ok=True)
+    rows = []
+    with contextlib.ExitStack() as stack:
+        # ✅ Days parsed once here and handed to every run through shared memory
+        days = [(name, stack.enter_context(SharedEggs(eggs))) for name, eggs in load_history(sources)]
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            futures = {
+                pool.submit(replay, strategy, seed, days, thresholds, max_thresholds, config): (strategy, seed)
+                for strategy, seed in runs
+            }
+            for future in as_completed(futures):
+                run_rows = future.result()
+                rows.extend(run_rows)
+                strategy, seed = futures[future]
+                print(f"{strategy} (seed {seed}): {sum(row['fn_count'] for row in run_rows)} FNs over "
+                      f"{len(run_rows)} days in {sum(row['seconds'] for row in run_rows):.1f}s")
+
+    order = {strategy: i for i, strategy in enumerate(strategies)}
+    rows.sort(key=lambda row: (order[row["strategy"]], row["seed"], row["day"]))
+    with open(os.path.join(output_dir, "backtest.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    if rows:
+        with open(os.path.join(output_dir, "backtest.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+def summarize(rows):
+    # ✅ Total and last-day FN count per strategy (mean over seeds), lowest total first
+    totals = {}
+    for row in rows:
+        run = totals.setdefault(row["strategy"], {})
+        run.setdefault(row["seed"], []).append(row["fn_count"])
+    summary = [
+        {
+            "strategy": strategy,
+            "seeds": len(by_seed),
+            "total_fns": float(np.mean([sum(counts) for counts in by_seed.values()])),
+            "last_day_fns": float(np.mean([counts[-1] for counts in by_seed.values()])),
+        }
+        for strategy, by_seed in totals.items()
+    ]
+    return sorted(summary, key=lambda run: run["total_fns"])
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Replay historical days under several calibration strategies.")
+    parser.add_argument("inputs", nargs="+", help="day files, zip/tar archives of them, an egg archive or a machine directory")
+    parser.add_argument("--strategies", nargs="*", choices=list(STRATEGIES), default=list(STRATEGIES))
+    parser.add_argument("--seeds", type=int, nargs="*", default=[0], help="seeds of the seeded strategies (PPO)")
+    parser.add_argument("--workers", type=int, default=None, help="runs replayed at once (default: all cores)")
+    parser.add_argument("--restart-workers", type=int, default=None, help="PPO restarts in parallel per run")
+    parser.add_argument("--daily-cap", type=float, default=DAILY_CAP)
+    parser.add_argument("--output", default=BACKTEST_OUTPUT_DIR, help="backtest.csv/json and the PPO registries")
+    args = parser.parse_args()
+
+    rows = backtest(args.inputs, args.strategies, args.seeds, workers=args.workers, output_dir=args.output, config={
+        "restart_workers": args.restart_workers,
+        "daily_cap": args.daily_cap,
+    })
+    for run in summarize(rows):
+        print(f"{run['strategy']:>14}: {run['total_fns']:g} FNs in total, {run['last_day_fns']:g} on the last day "
+              f"({run['seeds']} seed(s))")
+    print(f"Backtest table saved in {os.path.join(args.output, 'backtest.csv')}")
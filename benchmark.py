@@ -0,0 +1,177 @@
+import argparse
+import glob
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+
+from egg_generator import BUNDLED_DAYS, fit_model, write_batch
+from egg_store import extract_fns, load_eggs
+from label_registry import CALIBRATED_LABELS, ceilings, preset_thresholds
+
+# ✅ Thresholds and ceilings of the calibration loop
+thresholds = preset_thresholds(CALIBRATED_LABELS)
+max_thresholds = ceilings(thresholds)
+
+DEFAULT_SIZES = [650, 10_000, 100_000, 1_000_000]
+BENCHMARKS = ["parse", "archive_load", "extract_fns", "env_step", "extract_fn_cli", "day_sweep", "day_ppo"]
+
+
+def write_dataset(path, n_eggs, seed=0):
+    # ✅ Synthetic day batch calibrated on the bundled day files
+    write_batch(path, fit_model(sorted(glob.glob(BUNDLED_DAYS))), n_eggs, seed=seed)
+
+
+def _peak_rss_mb():
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def _run_benchmark(name, path, n_eggs, env_steps):
+    # ✅ Runs in a fresh process so peak memory belongs to this benchmark only
+    rss_before = _peak_rss_mb()
+    started = time.perf_counter()
+    result = {"benchmark": name, "eggs": n_eggs}
+
+    if name == "parse":
+        load_eggs(path)
+        result["eggs_per_sec"] = n_eggs / (time.perf_counter() - started)
+
+    elif name == "archive_load":
+        from egg_archive import ArchiveWriter
+
+        with tempfile.TemporaryDirectory() as tmp:
+            archive = os.path.join(tmp, "eggs.eggs")
+            ArchiveWriter(archive).append(1, path)
+            # ✅ Time the memory-mapped load only (plus one pass over the values to page them in)
+            started = time.perf_counter()
+            result["checksum"] = float(load_eggs(archive).values.sum(dtype=np.float64))
+            result["eggs_per_sec"] = n_eggs / (time.perf_counter() - started)
+            result["wall_sec"] = time.perf_counter() - started
+
+    elif name == "extract_fns":
+        eggs = load_eggs(path)
+        parsed = time.perf_counter()
+        fns = extract_fns(eggs, thresholds)
+        result["fns"] = len(fns)
+        result["scan_eggs_per_sec"] = n_eggs / (time.perf_counter() - parsed)
+        result["eggs_per_sec"] = n_eggs / (time.perf_counter() - started)
+
+    elif name == "env_step":
+        from fn_rl_env import FNThresholdEnv
+
+        fns = extract_fns(load_eggs(path), thresholds)
+        built = time.perf_counter()
+        env = FNThresholdEnv(fns, thresholds, max_thresholds)
+        result["fns"] = len(fns)
+        result["env_build_sec"] = time.perf_counter() - built
+
+        rng = np.random.default_rng(0)
+        actions = rng.uniform(-1, 2, (env_steps, len(thresholds))).astype(np.float32)
+        env.reset()
+        stepped = time.perf_counter()
+        for action in actions:
+            env.step(action)
+        result["env_steps_per_sec"] = env_steps / (time.perf_counter() - stepped)
+
+        # ✅ Full rescan for comparison with the incremental count
+        counted = time.perf_counter()
+        for _ in range(100):
+            env._full_fn_count()
+        result["full_fn_counts_per_sec"] = 100 / (time.perf_counter() - counted)
+
+    elif name == "extract_fn_cli":
+        from extractFN import extract_1_percent_fns
+
+        with tempfile.TemporaryDirectory() as tmp:
+            result["fns"] = extract_1_percent_fns(path, os.path.join(tmp, "fns.jsonl"))
+        result["eggs_per_sec"] = n_eggs / (time.perf_counter() - started)
+
+    elif name in ("day_sweep", "day_ppo"):
+        from calibration import calibrate_day
+
+        eggs = load_eggs(path)
+        with tempfile.TemporaryDirectory() as tmp:
+            config = {"engine": "sweep" if name == "day_sweep" else "ppo", "warm_start": False,
+                      "registry_dir": os.path.join(tmp, "models")}
+            cwd = os.getcwd()
+            os.chdir(tmp)
+            try:
+                _, result["fns"] = calibrate_day(2, eggs, thresholds, max_thresholds, config)
+            finally:
+                os.chdir(cwd)
+        result["eggs_per_sec"] = n_eggs / (time.perf_counter() - started)
+
+    result.setdefault("wall_sec", time.perf_counter() - started)
+    result["peak_rss_mb"] = _peak_rss_mb()
+    result["peak_rss_delta_mb"] = result["peak_rss_mb"] - rss_before
+    return result
+
+
+def run_benchmarks(sizes, benchmarks, env_steps=2000, seed=0):
+    results = []
+    context = multiprocessing.get_context("spawn")
+    with tempfile.TemporaryDirectory() as tmp:
+        for n_eggs in sizes:
+            path = os.path.join(tmp, f"eggs_{n_eggs}.jsonl")
+            write_dataset(path, n_eggs, seed)
+            for name in benchmarks:
+                with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+                    result = pool.submit(_run_benchmark, name, path, n_eggs, env_steps).result()
+                print(json.dumps(result))
+                results.append(result)
+    return results
+
+
+def _git_commit():
+    try:
+        return subprocess.check_output(["git", "rev-parse", "--short", "HEAD"], text=True, stderr=subprocess.DEVNULL,
+                                       cwd=os.path.dirname(os.path.abspath(__file__))).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path):
+    # ✅ Wall time ratio per (benchmark, size) against an earlier results file
+    with open(baseline_path) as f:
+        baseline = {(r["benchmark"], r["eggs"]): r for r in json.load(f)["results"]}
+    for result in results:
+        old = baseline.get((result["benchmark"], result["eggs"]))
+        if old:
+            ratio = result["wall_sec"] / old["wall_sec"] if old["wall_sec"] else float("inf")
+            print(f"{result['benchmark']:>15} {result['eggs']:>9} eggs: {ratio:.2f}x wall time vs baseline")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark extraction, env stepping and calibration.")
+    parser.add_argument("--sizes", type=lambda s: [int(x) for x in s.split(",")], default=DEFAULT_SIZES,
+                        help="comma separated dataset sizes in eggs")
+    parser.add_argument("--benchmarks", type=lambda s: s.split(","), default=[b for b in BENCHMARKS if b != "day_ppo"],
+                        help=f"comma separated subset of {','.join(BENCHMARKS)} (day_ppo is slow, off by default)")
+    parser.add_argument("--env-steps", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", default=None, help="results JSON (default: benchmark_<commit>.json)")
+    parser.add_argument("--compare", default=None, help="earlier results JSON to compare against")
+    args = parser.parse_args()
+
+    commit = _git_commit()
+    results = run_benchmarks(args.sizes, args.benchmarks, args.env_steps, args.seed)
+    output = args.output or f"benchmark_{commit or 'local'}.json"
+    with open(output, "w") as f:
+        json.dump({
+            "commit": commit,
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "cpu_count": os.cpu_count(),
+            "results": results,
+        }, f, indent=2)
+    print(f"Results saved as {output}")
+    if args.compare:
+        compare(results, args.compare)
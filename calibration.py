@@ -0,0 +1,270 @@
+import io
+import math
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from functools import partial
+
+import jsonlines
+import numpy as np
+
+from egg_index import evaluate_candidates
+from egg_store import SharedEggs, extract_fns
+from fn_rl_env import FNThresholdEnv
+from instrumentation import enable_metrics, metrics
+from label_registry import DAILY_CAP, compile_profile
+from model_registry import REGISTRY_DIR, ModelRegistry
+from policy_export import export_policy
+from threshold_solver import solve_thresholds
+
+# ✅ Default PPO budget per restart
+TOTAL_TIMESTEPS = 5000
+
+# ✅ Smaller budget when fine-tuning the previous day's policy (one rollout of whole 64-step mini-batches)
+FINETUNE_TIMESTEPS = 1536
+
+# ✅ Independent PPO restarts per day
+RESTARTS = 10
+
+# ✅ Daily FN batch files go here unless the run sets its own directory
+FN_BATCH_DIR = "fn_batches"
+
+# ✅ Rollout size PPO collects per update (split across the env copies; budgets below it get one smaller rollout)
+ROLLOUT_STEPS = 2048
+
+# ✅ Day loop settings (engine: "ppo" or "sweep", daily_cap: max threshold change per day,
+#    metrics_dir: write stage timings and counters there, None to turn them off,
+#    save_fn_batch: also write fn_training_day{day}.jsonl into fn_batch_dir; training never reads it back,
+#    early_stopping: end a restart on zero FNs, an FN plateau or thresholds pinned at the ceiling,
+#    skip_restarts: stop the restarts that can no longer win once one reaches zero FNs)
+DEFAULT_CONFIG = {
+    "engine": "ppo",
+    "n_envs": 1,
+    "vec_env": "dummy",
+    "restart_workers": None,
+    "base_seed": 0,
+    "daily_cap": DAILY_CAP,
+    "warm_start": True,
+    "finetune_timesteps": FINETUNE_TIMESTEPS,
+    "registry_dir": REGISTRY_DIR,
+    "metrics_dir": None,
+    "save_fn_batch": True,
+    "fn_batch_dir": FN_BATCH_DIR,
+    "early_stopping": True,
+    "skip_restarts": True,
+}
+
+
+def make_vec_env(fn_file, thresholds, max_thresholds, n_envs=1, vec_env="dummy"):
+    # ✅ N copies of the env, in-process ("dummy") or one subprocess each ("subproc")
+    #    stable_baselines3 (and torch) are imported here, only when training is requested
+    from stable_baselines3.common.vec_env import DummyVecEnv, SubprocVecEnv
+
+    env_fns = [partial(FNThresholdEnv, fn_file, thresholds, max_thresholds) for _ in range(n_envs)]
+    if vec_env == "subproc" and n_envs > 1:
+        return SubprocVecEnv(env_fns)
+    return DummyVecEnv(env_fns)
+
+
+def rollout_steps(n_envs=1, total_timesteps=ROLLOUT_STEPS):
+    # ✅ Steps each env copy collects per PPO update
+    #    A budget below ROLLOUT_STEPS shrinks the rollout to it, otherwise PPO would still train a full 2048
+    return max(min(ROLLOUT_STEPS, total_timesteps) // n_envs, 64)
+
+
+def planned_timesteps(total_timesteps, n_envs=1):
+    # ✅ Timesteps a full run trains for: model.learn only stops after a whole rollout
+    rollout = rollout_steps(n_envs, total_timesteps) * n_envs
+    return math.ceil(total_timesteps / rollout) * rollout
+
+
+def train_model(fn_file, thresholds, max_thresholds, n_envs=1, vec_env="dummy",
+                total_timesteps=TOTAL_TIMESTEPS, seed=None, warm_start=None, callback=None, verbose=1):
+    # ✅ Train PPO on N env copies, keeping the rollout size per update the same
+    from stable_baselines3 import PPO
+
+    with metrics.stage("env_construction"):
+        train_env = make_vec_env(fn_file, thresholds, max_thresholds, n_envs, vec_env)
+    n_steps = rollout_steps(n_envs, total_timesteps)
+    with metrics.stage("model_setup"):
+        if warm_start:
+            # ✅ Fine-tune a saved policy (same label set, so the same spaces)
+            model = PPO.load(warm_start, env=train_env, custom_objects={"n_steps": n_steps}, verbose=verbose)
+            model.set_random_seed(seed)
+        else:
+            model = PPO("MlpPolicy", train_env, n_steps=n_steps, seed=seed, verbose=verbose)
+    with metrics.stage("model_learn"):
+        model.learn(total_timesteps=total_timesteps, callback=callback)
+    train_env.close()
+    return model
+
+
+def propose_thresholds(model, fn_file, thresholds, max_thresholds):
+    # ✅ Let the trained model adjust the thresholds 10 times on a single env
+    with metrics.stage("env_construction"):
+        env = FNThresholdEnv(fn_file, thresholds, max_thresholds)
+    with metrics.stage("propose_thresholds"):
+        obs, _ = env.reset()
+        for _ in range(10):
+            # ✅ No FNs left (the last observation entry): further steps could only cost ceiling margin
+            if obs[-1] == 0:
+                break
+            action, _ = model.predict(obs)
+            obs, reward, terminated, truncated, info = env.step(action)
+            if terminated or truncated:
+                obs, _ = env.reset()
+
+    return {key: float(obs[i]) for i, key in enumerate(thresholds.keys())}
+
+
+def train_candidate(fn_file, thresholds, max_thresholds, **train_kwargs):
+    model = train_model(fn_file, thresholds, max_thresholds, **train_kwargs)
+    return propose_thresholds(model, fn_file, thresholds, max_thresholds)
+
+
+def _init_worker():
+    # ✅ One torch thread per worker so restarts don't fight over the cores
+    import torch
+    torch.set_num_threads(1)
+
+
+def _run_restart(seed, fn_file, thresholds, max_thresholds, train_kwargs, restart=0, stop_after=None):
+    # ✅ stop_after: shared index of the earliest zero-FN restart; later restarts can't win and stop
+    from training_budget import EarlyStopping
+
+    train_kwargs = dict(train_kwargs)
+    early_stopping = train_kwargs.pop("early_stopping", False)
+    should_cancel = (lambda: restart > stop_after.value) if stop_after is not None else None
+    callback = EarlyStopping(should_cancel=should_cancel) if early_stopping else EarlyStopping(None, None, should_cancel)
+    model = train_model(fn_file, thresholds, max_thresholds, seed=seed, callback=callback, verbose=0, **train_kwargs)
+    candidate_thresholds = propose_thresholds(model, fn_file, thresholds, max_thresholds)
+    model_bytes = io.BytesIO()
+    model.save(model_bytes)
+    # ✅ NumPy export next to the SB3 zip, so the policy can be applied without torch
+    policy_bytes = export_policy(model, list(thresholds.keys()))
+    # ✅ Worker metrics go to their own record (the pool process doesn't share counters)
+    metrics.flush(seed, scope="restart")
+    budget = {"timesteps": int(model.num_timesteps), "stop_reason": callback.stop_reason}
+    return candidate_thresholds, model_bytes.getvalue(), policy_bytes, budget
+
+
+def best_candidate(fn_file, day_eggs, thresholds, max_thresholds, seeds, max_workers=None,
+                   skip_restarts=False, **train_kwargs):
+    # ✅ Run one PPO restart per seed in a process pool
+    #    With skip_restarts, a zero-FN candidate cancels every later restart (queued ones never start,
+    #    running ones stop at their next check); earlier restarts still finish, so the winner is the same
+    context = multiprocessing.get_context("spawn")
+    manager = context.Manager() if skip_restarts else None
+    stop_after = manager.Value("i", len(seeds)) if manager else None
+    last = len(seeds)
+    results = {}
+    try:
+        with ProcessPoolExecutor(max_workers=max_workers, mp_context=context, initializer=_init_worker) as pool:
+            futures = {
+                pool.submit(_run_restart, seed, fn_file, thresholds, max_thresholds, train_kwargs,
+                            restart, stop_after): restart
+                for restart, seed in enumerate(seeds)
+            }
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                restart = futures[future]
+                result = future.result()
+                # ✅ Score each candidate on the already parsed day as it arrives (no file I/O)
+                with metrics.stage("candidate_scoring"):
+                    fn_count = int(evaluate_candidates(day_eggs, [result[0]], percentage=1.0)[0])
+                results[restart] = (fn_count, result)
+                if stop_after is not None and fn_count == 0 and restart < last:
+                    last = stop_after.value = restart
+                    for other, other_restart in futures.items():
+                        if other_restart > restart:
+                            other.cancel()
+    finally:
+        if manager:
+            manager.shutdown()
+
+    # ✅ Lowest FN count wins, ties go to the earliest restart (same as the serial loop)
+    best = min((restart for restart in results if restart <= last), key=lambda restart: (results[restart][0], restart))
+    fn_count, (best_thresholds, best_model, best_policy, _) = results[best]
+
+    # ✅ Budget report: timesteps actually trained vs. the full budget of every restart
+    planned = planned_timesteps(train_kwargs.get("total_timesteps", TOTAL_TIMESTEPS),
+                                train_kwargs.get("n_envs", 1)) * len(seeds)
+    used = sum(result[3]["timesteps"] for _, result in results.values())
+    budget = {
+        "timesteps_planned": planned,
+        "timesteps_used": used,
+        "timesteps_saved": max(0, planned - used),
+        # ✅ Skipped: never started, or stopped part-way once an earlier restart reached zero FNs
+        "restarts_skipped": len(seeds) - len(results) + sum(
+            result[3]["stop_reason"] == "cancelled" for _, result in results.values()
+        ),
+        "stop_reasons": {str(restart): results[restart][1][3]["stop_reason"] for restart in sorted(results)},
+    }
+    return best_thresholds, fn_count, best_model, best_policy, budget
+
+
+def calibrate_day(day, day_eggs, thresholds, max_thresholds, config=None):
+    # ✅ One day of the calibration loop: returns the new thresholds and the day's FN count
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    if config["metrics_dir"]:
+        enable_metrics(config["metrics_dir"])
+    with metrics.stage("day_total"):
+        result = _calibrate_day(day, day_eggs, thresholds, max_thresholds, config)
+    metrics.flush(day)
+    return result
+
+
+def _calibrate_day(day, day_eggs, thresholds, max_thresholds, config):
+    fns_day = extract_fns(day_eggs, thresholds, percentage=1.0)
+
+    if day == 1:
+        # ✅ Day 1: Increase Thresholds by 1% (Initial Step)
+        return {key: round(value * 1.01, 2) for key, value in thresholds.items()}, len(fns_day)
+
+    if config["engine"] == "sweep":
+        # ✅ Exact sweep: optimal thresholds within the ceiling and daily cap
+        best_thresholds, _ = solve_thresholds(day_eggs, thresholds, max_thresholds, daily_cap=config["daily_cap"])
+        return best_thresholds, len(fns_day)
+
+    if config["save_fn_batch"]:
+        # ✅ The FN eggs as they were uploaded (exact sorter values), in the run's own directory
+        os.makedirs(config["fn_batch_dir"], exist_ok=True)
+        batch_path = os.path.join(config["fn_batch_dir"], f"fn_training_day{day}.jsonl")
+        with metrics.stage("file_write"), jsonlines.open(batch_path, "w") as writer:
+            for egg_list in fns_day.source_records():
+                writer.write(egg_list)
+
+    # ✅ Warm-start from the latest earlier winning policy for this label set
+    registry = ModelRegistry(config["registry_dir"])
+    labels = list(thresholds.keys())
+    warm_start = registry.latest(labels, before_day=day) if config["warm_start"] else None
+    total_timesteps = config["finetune_timesteps"] if warm_start else TOTAL_TIMESTEPS
+
+    # ✅ 10 independent restarts in a process pool (one seed per restart)
+    #    The FN batch goes to the workers and env copies through shared memory (no file round-trip)
+    seeds = [config["base_seed"] * 1000 + day * RESTARTS + restart for restart in range(RESTARTS)]
+    with SharedEggs(fns_day) as shared_fns:
+        best_thresholds, best_fn_count, best_model, best_policy, budget = best_candidate(
+            shared_fns, day_eggs, thresholds, max_thresholds, seeds,
+            max_workers=config["restart_workers"], skip_restarts=config["skip_restarts"],
+            n_envs=config["n_envs"], vec_env=config["vec_env"], total_timesteps=total_timesteps,
+            warm_start=warm_start, early_stopping=config["early_stopping"]
+        )
+    if metrics.enabled:
+        metrics.count("timesteps_used", budget["timesteps_used"])
+        metrics.count("timesteps_saved", budget["timesteps_saved"])
+        metrics.count("restarts_skipped", budget["restarts_skipped"])
+    with metrics.stage("file_write"):
+        registry.save(labels, day, best_model, {
+            "fn_count": best_fn_count,
+            "thresholds": best_thresholds,
+            "warm_start": warm_start,
+            "total_timesteps": total_timesteps,
+            **budget,
+        }, policy_bytes=best_policy)
+
+    # ✅ Limit Max Threshold Change per Day
+    profile = compile_profile(thresholds, max_thresholds, config["daily_cap"])
+    proposed = np.array([best_thresholds[label] for label in profile.labels])
+    return profile.to_dict(np.round(np.minimum(proposed, profile.thresholds + profile.daily_caps), 2)), len(fns_day)
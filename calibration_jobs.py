@@ -0,0 +1,251 @@
+import hashlib
+import json
+import os
+import shutil
+import signal
+import subprocess
+import sys
+import time
+import traceback
+
+import numpy as np
+
+from calibration import DEFAULT_CONFIG, calibrate_day
+from egg_store import EggStore
+
+# ✅ Background calibration jobs live here (one directory per job)
+JOBS_DIR = "jobs"
+
+# ✅ Job directories kept (least recently used finished or stopped jobs are deleted first)
+MAX_JOBS = 8
+
+# ✅ Seconds to wait for a stopped worker to exit
+STOP_TIMEOUT = 10
+
+# ✅ Worker processes started by this server, by job directory (polling them also reaps them)
+_workers = {}
+
+
+def _write_json(path, obj):
+    # ✅ Atomic write so a reader never sees a half-written checkpoint
+    with open(path + ".tmp", "w") as f:
+        json.dump(obj, f)
+    os.replace(path + ".tmp", path)
+
+
+def _read_json(path, default=None):
+    if not os.path.exists(path):
+        return default
+    with open(path) as f:
+        return json.load(f)
+
+
+def job_id(day_digests, thresholds, config):
+    # ✅ Same data, thresholds and config → same job, so a page refresh resumes it
+    #    (worker count, metrics directory and FN batch files don't change the result, so they're excluded;
+    #    the registry and FN batch directory are always the job's own)
+    settings = sorted((key, value) for key, value in config.items()
+                      if key not in ("restart_workers", "metrics_dir", "save_fn_batch", "registry_dir",
+                                     "fn_batch_dir"))
+    key = json.dumps([list(day_digests), list(thresholds.items()), settings])
+    return hashlib.sha256(key.encode()).hexdigest()[:16]
+
+
+def upload_key(day_digests):
+    # ✅ Identifies the uploaded days alone (jobs with other settings on the same upload share it)
+    return hashlib.sha256(json.dumps(list(day_digests)).encode()).hexdigest()[:16]
+
+
+def find_job(day_data, thresholds, config=None, jobs_dir=JOBS_DIR):
+    # ✅ Directory of the job for these days, thresholds and settings (it may not exist yet); marks it as used
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    job_dir = os.path.join(jobs_dir, job_id([digest for digest, _ in day_data], thresholds, config))
+    if os.path.exists(os.path.join(job_dir, "job.json")):
+        os.utime(os.path.join(job_dir, "job.json"))
+    return job_dir
+
+
+def read_state(job_dir):
+    return _read_json(os.path.join(job_dir, "state.json"), {})
+
+
+def read_progress(job_dir):
+    path = os.path.join(job_dir, "progress.jsonl")
+    if not os.path.exists(path):
+        return []
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def _worker_pid(job_dir):
+    pid_path = os.path.join(job_dir, "worker.pid")
+    if not os.path.exists(pid_path):
+        return None
+    with open(pid_path) as f:
+        return int(f.read() or 0) or None
+
+
+def is_running(job_dir):
+    process = _workers.get(os.path.abspath(job_dir))
+    if process is not None:
+        return process.poll() is None
+
+    # ✅ Worker started by an earlier server process: check its pid
+    pid = _worker_pid(job_dir)
+    if pid is None:
+        return False
+    try:
+        os.kill(pid, 0)
+    except (OSError, ValueError):
+        return False
+    # ✅ An exited child nobody waited on is a zombie, which still accepts signals
+    try:
+        with open(f"/proc/{pid}/stat") as f:
+            return f.read().rsplit(")", 1)[1].split()[0] != "Z"
+    except (OSError, IndexError):
+        return True
+
+
+def stop_job(job_dir):
+    # ✅ Terminates the worker and its process pools (one process group per worker); the job can be resumed
+    if not is_running(job_dir):
+        return
+    try:
+        os.killpg(_worker_pid(job_dir), signal.SIGTERM)
+    except OSError:
+        pass
+    process = _workers.pop(os.path.abspath(job_dir), None)
+    deadline = time.time() + STOP_TIMEOUT
+    if process is not None:
+        process.wait(timeout=STOP_TIMEOUT)
+    while is_running(job_dir) and time.time() < deadline:
+        time.sleep(0.1)
+    state = read_state(job_dir)
+    if state and state.get("status") != "done":
+        state["status"] = "stopped"
+        _write_json(os.path.join(job_dir, "state.json"), state)
+
+
+def _jobs(jobs_dir):
+    if not os.path.isdir(jobs_dir):
+        return []
+    return [os.path.join(jobs_dir, name) for name in os.listdir(jobs_dir)
+            if os.path.exists(os.path.join(jobs_dir, name, "job.json"))]
+
+
+def running_jobs(day_digests, jobs_dir=JOBS_DIR):
+    # ✅ Running jobs on these uploaded days (any settings)
+    key = upload_key(day_digests)
+    return [job_dir for job_dir in _jobs(jobs_dir)
+            if _read_json(os.path.join(job_dir, "job.json")).get("upload") == key and is_running(job_dir)]
+
+
+def evict_jobs(jobs_dir=JOBS_DIR, keep=(), max_jobs=MAX_JOBS):
+    # ✅ Delete the least recently used job directories beyond max_jobs (running jobs are never deleted)
+    keep = {os.path.abspath(job_dir) for job_dir in keep}
+    jobs = sorted(_jobs(jobs_dir), key=lambda job_dir: os.path.getmtime(os.path.join(job_dir, "job.json")),
+                  reverse=True)
+    for job_dir in jobs[max_jobs:]:
+        if os.path.abspath(job_dir) not in keep and not is_running(job_dir):
+            shutil.rmtree(job_dir, ignore_errors=True)
+
+
+def submit_job(day_data, thresholds, max_thresholds, config=None, jobs_dir=JOBS_DIR):
+    # ✅ day_data: list of (content digest, EggStore) in day order; returns the job directory
+    #    Starts (or resumes) the job and stops any other job still running on the same upload
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    day_digests = [digest for digest, _ in day_data]
+    job_dir = find_job(day_data, thresholds, config, jobs_dir)
+    os.makedirs(job_dir, exist_ok=True)
+    # ✅ Own model registry per job: concurrent jobs don't warm-start from each other's policies
+    config["registry_dir"] = os.path.abspath(os.path.join(job_dir, "models"))
+    config["fn_batch_dir"] = os.path.abspath(os.path.join(job_dir, "fn_batches"))
+
+    if not os.path.exists(os.path.join(job_dir, "job.json")):
+        # ✅ Day matrices are stored once so the worker (and a resumed worker) can memory-map them
+        #    plus the uploaded file itself, so FN batches are written with the exact sorter values
+        for day, (_, eggs) in enumerate(day_data, start=1):
+            np.save(os.path.join(job_dir, f"day_{day:02d}.npy"), eggs.values)
+            if isinstance(eggs.source, bytes):
+                with open(os.path.join(job_dir, f"day_{day:02d}.jsonl"), "wb") as f:
+                    f.write(eggs.source)
+        _write_json(os.path.join(job_dir, "job.json"), {
+            "days": len(day_data),
+            "thresholds": thresholds,
+            "max_thresholds": max_thresholds,
+            "config": config,
+            "upload": upload_key(day_digests),
+        })
+
+    for other in running_jobs(day_digests, jobs_dir):
+        if os.path.abspath(other) != os.path.abspath(job_dir):
+            stop_job(other)
+    if read_state(job_dir).get("status") != "done" and not is_running(job_dir):
+        start_worker(job_dir)
+    evict_jobs(jobs_dir, keep=[job_dir])
+    return job_dir
+
+
+def start_worker(job_dir):
+    # ✅ Detached process: survives browser disconnects and Streamlit reruns
+    with open(os.path.join(job_dir, "worker.log"), "a") as log:
+        process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), job_dir],
+            stdout=log, stderr=subprocess.STDOUT, start_new_session=True,
+        )
+    with open(os.path.join(job_dir, "worker.pid"), "w") as f:
+        f.write(str(process.pid))
+    _workers[os.path.abspath(job_dir)] = process
+    return process
+
+
+def run_job(job_dir):
+    job = _read_json(os.path.join(job_dir, "job.json"))
+    thresholds = job["thresholds"]
+
+    # ✅ Resume after the last finished day (checkpointed in state.json)
+    state = read_state(job_dir) or {
+        "completed_day": 0,
+        "thresholds": thresholds,
+        "threshold_history": {key: [value] for key, value in thresholds.items()},
+        "fn_counts": [],
+    }
+    state["status"] = "running"
+    _write_json(os.path.join(job_dir, "state.json"), state)
+
+    try:
+        for day in range(state["completed_day"] + 1, job["days"] + 1):
+            started = time.time()
+            source = os.path.join(job_dir, f"day_{day:02d}.jsonl")
+            day_eggs = EggStore(np.load(os.path.join(job_dir, f"day_{day:02d}.npy"), mmap_mode="r"),
+                                source=source if os.path.exists(source) else None)
+            new_thresholds, fn_count = calibrate_day(day, day_eggs, state["thresholds"],
+                                                     job["max_thresholds"], job["config"])
+
+            # ✅ Checkpoint thresholds and FN counts after every day (models go to the registry)
+            state["completed_day"] = day
+            state["thresholds"] = new_thresholds
+            state["fn_counts"].append(fn_count)
+            for key, value in new_thresholds.items():
+                state["threshold_history"][key].append(value)
+            _write_json(os.path.join(job_dir, "state.json"), state)
+
+            with open(os.path.join(job_dir, "progress.jsonl"), "a") as f:
+                f.write(json.dumps({
+                    "day": day,
+                    "fn_count": fn_count,
+                    "thresholds": new_thresholds,
+                    "seconds": round(time.time() - started, 2),
+                }) + "\n")
+
+        state["status"] = "done"
+    except Exception:
+        state["status"] = "failed"
+        state["error"] = traceback.format_exc()
+        raise
+    finally:
+        _write_json(os.path.join(job_dir, "state.json"), state)
+
+
+if __name__ == "__main__":
+    run_job(sys.argv[1])
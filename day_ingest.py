@@ -0,0 +1,185 @@
+import argparse
+import hashlib
+import io
+import json
+import math
+import multiprocessing
+import os
+import sys
+import tarfile
+import zipfile
+from concurrent.futures import ProcessPoolExecutor
+
+from egg_archive import day_number
+from egg_store import parse_eggs
+from label_registry import LABELS
+
+# ✅ Day files taken from uploads and from inside zip/tar archives
+DAY_SUFFIX = ".jsonl"
+
+# ✅ Problems listed per file (the rest are only counted)
+MAX_REPORTED_PROBLEMS = 20
+
+# ✅ Below this much data the files are parsed in-process (starting workers would cost more)
+MIN_PARALLEL_BYTES = 8_000_000
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+
+
+def expand_uploads(files):
+    # ✅ [(name, bytes)] of the day files: plain files as they are, zip/tar archives unpacked in memory
+    day_files = []
+    for name, content in files:
+        buffer = io.BytesIO(content)
+        if zipfile.is_zipfile(buffer):
+            with zipfile.ZipFile(buffer) as archive:
+                members = [(member.filename, archive.read(member)) for member in archive.infolist()
+                           if not member.is_dir()]
+        elif not name.endswith(DAY_SUFFIX) and _is_tar(buffer):
+            with tarfile.open(fileobj=io.BytesIO(content), mode="r:*") as archive:
+                members = [(member.name, archive.extractfile(member).read()) for member in archive.getmembers()
+                           if member.isfile()]
+        else:
+            day_files.append((name, content))
+            continue
+        # ✅ Skip archive metadata (macOS resource forks) and non-day files
+        day_files.extend(
+            (os.path.basename(member), data) for member, data in sorted(members)
+            if member.endswith(DAY_SUFFIX) and not os.path.basename(member).startswith("._")
+            and "__MACOSX" not in member
+        )
+    return day_files
+
+
+def _is_tar(buffer):
+    try:
+        with tarfile.open(fileobj=buffer, mode="r:*"):
+            return True
+    except tarfile.TarError:
+        return False
+    finally:
+        buffer.seek(0)
+
+
+def check_records(lines):
+    # ✅ Decoded records of a day file plus [(line number, problem)] for the ones parse_eggs would misread
+    records = []
+    problems = []
+    flat_labels = 0
+    layout = None
+    for line_number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            record = json.loads(line)
+        except ValueError as error:
+            problems.append((line_number, f"invalid JSON ({error})"))
+            continue
+
+        if isinstance(record, list):
+            record_layout = "list"
+            bad = [item for item in record if not (isinstance(item, dict) and "Label" in item
+                                                   and _is_number(item.get("Value", 0)))]
+            if bad:
+                problems.append((line_number, f"egg has {len(bad)} item(s) without a Label and numeric Value"))
+        elif isinstance(record, dict) and "Label" in record:
+            record_layout = "flat"
+            flat_labels += 1
+            if not _is_number(record.get("Value", 0)):
+                problems.append((line_number, f"non-numeric Value {record.get('Value')!r} for {record['Label']}"))
+        elif isinstance(record, dict):
+            record_layout = "translated"
+            bad = [key for key, value in record.items() if key != "MaxDeviation" and not _is_number(value)]
+            if bad:
+                problems.append((line_number, f"non-numeric value for {', '.join(bad)}"))
+        else:
+            problems.append((line_number, f"expected an egg list or label record, got {type(record).__name__}"))
+            continue
+
+        # ✅ Flat files regroup every len(LABELS) lines into an egg, so mixing layouts shifts every egg after it
+        if layout is None:
+            layout = record_layout
+        elif record_layout != layout:
+            problems.append((line_number, f"{record_layout} record in a {layout} file"))
+        records.append(record)
+
+    if layout == "flat" and flat_labels % len(LABELS):
+        problems.append((None, f"last egg has {flat_labels % len(LABELS)} of {len(LABELS)} labels"))
+    if not records and not problems:
+        problems.append((None, "no eggs"))
+    return records, problems
+
+
+def ingest_file(name, content):
+    # ✅ One day file: content hash, parsed EggStore (None when invalid) and its problems
+    records, problems = check_records(io.BytesIO(content))
+    eggs = None
+    if not problems:
+        eggs = parse_eggs(records)
+        eggs.source = content
+    return {
+        "name": name,
+        "digest": hashlib.sha256(content).hexdigest(),
+        "eggs": eggs,
+        "problems": problems,
+    }
+
+
+def ingest_days(files, workers=None):
+    # ✅ files: [(name, bytes)] of day files and/or zip/tar archives of them
+    #    Returns the day files in day order (day number from the name, else upload order), each parsed and checked
+    day_files = expand_uploads(files)
+    order = sorted(range(len(day_files)),
+                   key=lambda i: (day_number(day_files[i][0], math.inf), i))
+    day_files = [day_files[i] for i in order]
+
+    total_bytes = sum(len(content) for _, content in day_files)
+    workers = min(workers or os.cpu_count() or 1, len(day_files))
+    if workers > 1 and total_bytes >= MIN_PARALLEL_BYTES:
+        context = multiprocessing.get_context("spawn")
+        with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+            days = list(pool.map(ingest_file, *zip(*day_files)))
+    else:
+        days = [ingest_file(name, content) for name, content in day_files]
+
+    # ✅ Two files for the same day would both be calibrated as consecutive days
+    seen = {}
+    for day in days:
+        number = day_number(day["name"])
+        if number is not None and number in seen:
+            day["problems"].append((None, f"day {number} also in {seen[number]}"))
+        seen.setdefault(number, day["name"])
+    return days
+
+
+def problem_report(days):
+    # ✅ Human-readable lines of every problem, capped per file
+    lines = []
+    for day in days:
+        problems = day["problems"]
+        for line_number, problem in problems[:MAX_REPORTED_PROBLEMS]:
+            lines.append(f"{day['name']}" + (f" line {line_number}" if line_number else "") + f": {problem}")
+        if len(problems) > MAX_REPORTED_PROBLEMS:
+            lines.append(f"{day['name']}: {len(problems) - MAX_REPORTED_PROBLEMS} more problems")
+    return lines
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Check day files (JSONL, or zip/tar archives of them) before calibration.")
+    parser.add_argument("inputs", nargs="+", help="day files and/or archives")
+    parser.add_argument("--workers", type=int, default=None, help="parse processes (default: all cores)")
+    args = parser.parse_args()
+
+    files = []
+    for path in args.inputs:
+        with open(path, "rb") as f:
+            files.append((os.path.basename(path), f.read()))
+    days = ingest_days(files, args.workers)
+    for number, day in enumerate(days, start=1):
+        eggs = len(day["eggs"]) if day["eggs"] is not None else "-"
+        print(f"Day {number}: {day['name']} ({eggs} eggs)")
+    report = problem_report(days)
+    print("\n".join(report) if report else "All day files are valid.")
+    sys.exit(1 if report else 0)
@@ -0,0 +1,159 @@
+import argparse
+import json
+import os
+import re
+import struct
+
+import numpy as np
+
+from egg_store import EggStore, concat_eggs, load_eggs
+from label_registry import LABELS
+
+# ✅ File layout: magic, label dictionary header, then one block per appended day
+#    [MAGIC][u32 header length][JSON {"labels": [...]}][pad]
+#    per block: [BLOCK_MAGIC][i64 day][i64 eggs][i64 labels][float32 eggs×labels][float32 MaxDeviation × eggs][pad]
+MAGIC = b"EGGARCH1"
+BLOCK_MAGIC = b"EGGBLOCK"
+BLOCK_HEADER = struct.Struct("<8sqqq")
+
+# ✅ Blocks start on 64-byte boundaries so the float32 arrays are aligned views of the mapping
+ALIGNMENT = 64
+
+ARCHIVE_SUFFIX = ".eggs"
+
+
+def _padding(offset):
+    return -offset % ALIGNMENT
+
+
+def day_number(path, default=None):
+    # ✅ Day taken from a 'day<N>' / 'day_<N>' file name
+    match = re.search(r"day_?(\d+)", os.path.basename(path))
+    return int(match.group(1)) if match else default
+
+
+def is_archive(path):
+    if not isinstance(path, str) or not os.path.isfile(path):
+        return False
+    with open(path, "rb") as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+class ArchiveWriter:
+    # ✅ Append-only: blocks are only ever added at the end (a later block for the same day replaces it on read)
+    def __init__(self, path, labels=LABELS):
+        self.path = path
+        if os.path.exists(path) and os.path.getsize(path):
+            reader = ArchiveReader(path)
+            self.labels = reader.labels
+            end = reader.end
+            del reader
+            # ✅ Drop the torn tail of an interrupted append so new blocks stay reachable
+            if end < os.path.getsize(path):
+                os.truncate(path, end)
+        else:
+            self.labels = list(labels)
+            header = json.dumps({"labels": self.labels}).encode()
+            start = len(MAGIC) + 4 + len(header)
+            with open(path, "wb") as f:
+                f.write(MAGIC + struct.pack("<I", len(header)) + header + b"\0" * _padding(start))
+        self._columns = [LABELS.index(label) for label in self.labels]
+
+    def append(self, day, eggs):
+        eggs = load_eggs(eggs)
+        values = np.ascontiguousarray(eggs.values[:, self._columns], dtype="<f4")
+        max_deviation = np.ascontiguousarray(eggs.max_deviation, dtype="<f4")
+
+        with open(self.path, "ab") as f:
+            f.write(BLOCK_HEADER.pack(BLOCK_MAGIC, int(day), len(eggs), len(self.labels)))
+            f.write(values.tobytes())
+            f.write(max_deviation.tobytes())
+            f.write(b"\0" * _padding(f.tell()))
+        return len(eggs)
+
+
+class ArchiveReader:
+    # ✅ Memory-maps the whole archive; day batches are zero-copy views into the mapping
+    def __init__(self, path):
+        self.path = path
+        self._buffer = np.memmap(path, dtype=np.uint8, mode="r")
+        if bytes(self._buffer[:len(MAGIC)]) != MAGIC:
+            raise ValueError(f"{path} is not an egg archive")
+
+        header_length = struct.unpack_from("<I", self._buffer, len(MAGIC))[0]
+        start = len(MAGIC) + 4
+        self.labels = json.loads(bytes(self._buffer[start:start + header_length]))["labels"]
+
+        # ✅ Index the blocks by walking their headers (no value is read)
+        self._blocks = {}
+        offset = start + header_length
+        offset += _padding(offset)
+        while offset + BLOCK_HEADER.size <= len(self._buffer):
+            magic, day, n_eggs, n_labels = BLOCK_HEADER.unpack_from(self._buffer, offset)
+            end = offset + BLOCK_HEADER.size + 4 * n_eggs * (n_labels + 1)
+            if magic != BLOCK_MAGIC or n_labels != len(self.labels) or end > len(self._buffer):
+                # ✅ Torn tail of an interrupted append: everything before it is still valid
+                break
+            self._blocks[int(day)] = (offset + BLOCK_HEADER.size, int(n_eggs))
+            offset = end + _padding(end)
+        self.end = offset
+
+        # ✅ Same label order as EggStore → no column reordering (and no copy) on read
+        self._columns = None if self.labels == list(LABELS) else [
+            self.labels.index(label) if label in self.labels else None for label in LABELS
+        ]
+
+    @property
+    def days(self):
+        return sorted(self._blocks)
+
+    def __len__(self):
+        return sum(n_eggs for _, n_eggs in self._blocks.values())
+
+    def day(self, day, start=0, stop=None):
+        offset, n_eggs = self._blocks[day]
+        stop = n_eggs if stop is None else min(stop, n_eggs)
+        width = len(self.labels)
+        values = np.ndarray((n_eggs, width), dtype="<f4", buffer=self._buffer, offset=offset)[start:stop]
+        max_deviation = np.ndarray((n_eggs,), dtype="<f4", buffer=self._buffer,
+                                   offset=offset + 4 * n_eggs * width)[start:stop]
+
+        if self._columns is not None:
+            reordered = np.zeros((len(values), len(LABELS)), dtype=np.float32)
+            for i, column in enumerate(self._columns):
+                if column is not None:
+                    reordered[:, i] = values[:, column]
+            values = reordered
+        return EggStore(values, max_deviation, np.arange(start, stop, dtype=np.int64))
+
+    def iter_days(self, days=None):
+        # ✅ (day, zero-copy view) per day in day order
+        for day in (self.days if days is None else days):
+            yield day, self.day(day)
+
+    def eggs(self, days=None):
+        # ✅ One day is a view; several days are concatenated in day order (a copy, see iter_days)
+        return concat_eggs(eggs for _, eggs in self.iter_days(days))
+
+
+def convert(jsonl_paths, archive_path, days=None):
+    # ✅ Append JSONL day files to an archive; the day is taken from the file name unless given
+    writer = ArchiveWriter(archive_path)
+    converted = []
+    for i, path in enumerate(jsonl_paths):
+        day = days[i] if days is not None else day_number(path, i + 1)
+        converted.append((day, path, writer.append(day, path)))
+    return converted
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Convert JSONL day files into a memory-mapped egg archive.")
+    parser.add_argument("archive", help=f"archive to create or append to (e.g. history{ARCHIVE_SUFFIX})")
+    parser.add_argument("inputs", nargs="+", help="JSONL day files (day number read from 'day<N>' in the name)")
+    parser.add_argument("--first-day", type=int, default=None, help="number the inputs from this day instead")
+    args = parser.parse_args()
+
+    days = None if args.first_day is None else list(range(args.first_day, args.first_day + len(args.inputs)))
+    for day, path, n_eggs in convert(args.inputs, args.archive, days):
+        print(f"Day {day}: {n_eggs} eggs from {path}")
+    print(f"Archive saved as {args.archive}")
@@ -0,0 +1,110 @@
+import argparse
+import glob
+import json
+import os
+
+import numpy as np
+
+from egg_store import load_eggs
+from label_registry import LABEL_INDEX, LABELS
+
+# ✅ Bundled day files the generator is calibrated on
+BUNDLED_DAYS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fn_training_day*.jsonl")
+
+# ✅ Points of the fitted per-label quantile functions
+QUANTILE_POINTS = 201
+
+# ✅ Eggs generated per chunk (memory stays constant, output is reproducible for a given chunk size)
+CHUNK_EGGS = 10_000
+
+
+def fit_model(files):
+    values = np.concatenate([load_eggs(file).values for file in files]).astype(np.float64)
+
+    # ✅ Group labels are sums of member labels: fit the 0/1 membership by least squares
+    groups = {}
+    base = [i for i, label in enumerate(LABELS) if not label.startswith("groep_")]
+    for i, label in enumerate(LABELS):
+        if label.startswith("groep_"):
+            coefficients = np.linalg.lstsq(values[:, base], values[:, i], rcond=None)[0]
+            groups[label] = [LABELS[base[j]] for j in np.flatnonzero(np.round(coefficients) == 1)]
+
+    # ✅ Joint zero/non-zero patterns of the base labels keep their co-occurrence (and so the zero rates)
+    patterns, counts = np.unique(values[:, base] > 0, axis=0, return_counts=True)
+
+    # ✅ Per-label quantile function of the non-zero values
+    quantiles = {}
+    for j in base:
+        non_zero = values[values[:, j] > 0, j]
+        if len(non_zero):
+            quantiles[LABELS[j]] = np.quantile(non_zero, np.linspace(0, 1, QUANTILE_POINTS)).tolist()
+
+    return {
+        "base_labels": [LABELS[j] for j in base],
+        "patterns": patterns.astype(int).tolist(),
+        "pattern_probabilities": (counts / counts.sum()).tolist(),
+        "quantiles": quantiles,
+        "groups": groups,
+    }
+
+
+def generate_chunks(model, n_eggs, seed=0, chunk_eggs=CHUNK_EGGS):
+    # ✅ Yields eggs × labels float64 blocks of at most chunk_eggs rows
+    rng = np.random.default_rng(seed)
+    base = [LABEL_INDEX[label] for label in model["base_labels"]]
+    patterns = np.array(model["patterns"], dtype=bool)
+    probabilities = np.array(model["pattern_probabilities"])
+    grid = np.linspace(0, 1, QUANTILE_POINTS)
+
+    for start in range(0, n_eggs, chunk_eggs):
+        size = min(chunk_eggs, n_eggs - start)
+        values = np.zeros((size, len(LABELS)))
+        masks = patterns[rng.choice(len(patterns), size=size, p=probabilities)]
+
+        for j, label in enumerate(model["base_labels"]):
+            rows = np.flatnonzero(masks[:, j])
+            if label in model["quantiles"] and len(rows):
+                # ✅ Inverse-CDF sampling, interpolated in log space for the heavy tails
+                log_quantiles = np.log(model["quantiles"][label])
+                values[rows, base[j]] = np.exp(np.interp(rng.random(len(rows)), grid, log_quantiles))
+
+        for group, members in model["groups"].items():
+            values[:, LABEL_INDEX[group]] = values[:, [LABEL_INDEX[member] for member in members]].sum(axis=1)
+
+        yield values
+
+
+def write_batch(path, model, n_eggs, seed=0, layout="list", chunk_eggs=CHUNK_EGGS):
+    # ✅ layout "list": one egg per line (fn_training_day*), "flat": one label per line (fn_training_data_day4)
+    with open(path, "w") as f:
+        for values in generate_chunks(model, n_eggs, seed, chunk_eggs):
+            for row in values.tolist():
+                items = [{"Label": label, "Value": value} for label, value in zip(LABELS, row)]
+                if layout == "flat":
+                    f.writelines(json.dumps(item) + "\n" for item in items)
+                else:
+                    f.write(json.dumps(items) + "\n")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate synthetic egg batches calibrated on existing day files.")
+    parser.add_argument("output", help="output JSONL; use {day} in the name to write several days")
+    parser.add_argument("--eggs", type=int, default=100_000, help="eggs per day")
+    parser.add_argument("--days", type=int, default=1)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--layout", choices=["list", "flat"], default="list")
+    parser.add_argument("--fit", nargs="*", default=None, help="day files to fit on (default: bundled fn_training_day*.jsonl)")
+    parser.add_argument("--save-model", default=None, help="also write the fitted model as JSON")
+    args = parser.parse_args()
+    if args.days > 1 and "{day}" not in args.output:
+        parser.error("use {day} in the output name when writing several days")
+
+    model = fit_model(args.fit or sorted(glob.glob(BUNDLED_DAYS)))
+    if args.save_model:
+        with open(args.save_model, "w") as f:
+            json.dump(model, f, indent=2)
+
+    for day in range(1, args.days + 1):
+        path = args.output.format(day=day)
+        write_batch(path, model, args.eggs, seed=args.seed * 1000 + day, layout=args.layout)
+        print(f"Day {day}: {args.eggs} eggs saved as {path}")
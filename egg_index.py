@@ -0,0 +1,165 @@
+import numpy as np
+
+from egg_store import load_eggs, threshold_vector
+from label_registry import compile_profile, label_id
+
+# ✅ Window sizes of the what-if curves: 0.1% to 10% in 0.1% steps
+CURVE_PERCENTAGES = np.round(np.arange(1, 101) / 10, 1)
+
+# ✅ Threshold sets whose per-egg deviations are kept per index
+MAX_CACHED_PROFILES = 16
+
+# ✅ Upper bound on candidates × eggs × labels per broadcast block
+CANDIDATE_CHUNK_ELEMENTS = 4_000_000
+
+
+def window_bounds(sorted_values, thresholds, percentage):
+    # ✅ [lower, upper) positions of the values with 0 < (v - t) / t * 100 <= p (values sorted ascending)
+    thresholds = np.asarray(thresholds, dtype=np.float64)
+    percentage = np.asarray(percentage, dtype=np.float64)
+
+    def deviation(index):
+        values = sorted_values[np.clip(index, 0, len(sorted_values) - 1)]
+        return ((values - thresholds) / thresholds) * 100
+
+    lower = np.searchsorted(sorted_values, thresholds, side="right")
+    upper = np.searchsorted(sorted_values, thresholds * (1 + percentage / 100), side="right")
+    lower, upper = np.broadcast_arrays(lower, upper)
+    upper = upper.copy()
+    if not len(sorted_values):
+        return lower, upper
+
+    # ✅ Fix up float rounding so the bound matches the exact deviation formula
+    for _ in range(4):
+        step_back = (upper > lower) & (deviation(upper - 1) > percentage)
+        step_forward = (upper < len(sorted_values)) & (deviation(upper) <= percentage)
+        if not (step_back.any() or step_forward.any()):
+            break
+        upper = upper - step_back + step_forward
+
+    return lower, np.maximum(upper, lower)
+
+
+class EggIndex:
+    # ✅ Built once per dataset: per-label sorted values answer window queries by binary search
+    def __init__(self, eggs):
+        self.eggs = load_eggs(eggs)
+        self._sorted = {}
+        self._deviations = {}
+
+    def __len__(self):
+        return len(self.eggs)
+
+    def _label(self, label):
+        # ✅ Sorted column (float64, same as the deviation formula) and the egg of each position
+        i = label_id(label)
+        if i not in self._sorted:
+            column = self.eggs.values[:, i].astype(np.float64)
+            order = np.argsort(column, kind="stable")
+            self._sorted[i] = (column[order], order)
+        return self._sorted[i]
+
+    def count(self, label, threshold, percentage=1.0):
+        # ✅ Eggs with this label in (t, t(1 + p)]; threshold and percentage broadcast
+        sorted_values, _ = self._label(label)
+        lower, upper = window_bounds(sorted_values, threshold, percentage)
+        return upper - lower
+
+    def eggs_in_window(self, label, threshold, percentage=1.0):
+        sorted_values, order = self._label(label)
+        lower, upper = window_bounds(sorted_values, float(threshold), float(percentage))
+        return np.sort(order[int(lower):int(upper)])
+
+    def min_deviation(self, thresholds):
+        # ✅ Per egg: smallest positive deviation over the used labels (inf = never an FN), sorted
+        #    An egg is an FN for window p exactly when this is <= p
+        vector = threshold_vector(thresholds)
+        key = vector.tobytes()
+        if key not in self._deviations:
+            if len(self._deviations) >= MAX_CACHED_PROFILES:
+                self._deviations.pop(next(iter(self._deviations)))
+            used = np.isfinite(vector)
+            deviation = ((self.eggs.values[:, used].astype(np.float64) - vector[used]) / vector[used]) * 100
+            smallest = np.where(deviation > 0, deviation, np.inf).min(axis=1, initial=np.inf)
+            order = np.argsort(smallest, kind="stable")
+            self._deviations[key] = (smallest[order], order)
+        return self._deviations[key]
+
+    def count_fns(self, thresholds, percentage=1.0):
+        # ✅ Same count as egg_store.count_fns, for any window, after one pass per threshold set
+        smallest, _ = self.min_deviation(thresholds)
+        return np.searchsorted(smallest, percentage, side="right")
+
+    def extract_fns(self, thresholds, percentage=1.0):
+        smallest, order = self.min_deviation(thresholds)
+        return self.eggs.take(np.sort(order[:np.searchsorted(smallest, percentage, side="right")]))
+
+    def window_curves(self, thresholds, percentages=CURVE_PERCENTAGES):
+        # ✅ FN count per window size: per label and for the eggs as a whole (any label in its window)
+        profile = compile_profile(thresholds)
+        percentages = np.asarray(percentages, dtype=np.float64)
+        per_label = {
+            label: self.count(label, threshold, percentages)
+            for label, threshold in zip(profile.labels, profile.thresholds.tolist())
+        }
+        return {
+            "percentages": percentages,
+            "fns": self.count_fns(profile, percentages),
+            "per_label": per_label,
+        }
+
+
+def window_curves(eggs, thresholds, percentages=CURVE_PERCENTAGES):
+    return EggIndex(eggs).window_curves(thresholds, percentages)
+
+
+
+def evaluate_candidates(eggs, candidates, labels=None, percentage=1.0, return_masks=False,
+                        chunk_elements=CANDIDATE_CHUNK_ELEMENTS):
+    # ✅ FN count (and optionally the K × eggs FN mask) of K candidate threshold vectors in one chunked pass
+    #    candidates: list of {label: threshold} dicts, or a K × len(labels) matrix with labels given
+    eggs = load_eggs(eggs)
+    if labels is None:
+        labels = list(candidates[0].keys()) if len(candidates) else []
+        candidates = [[float(candidate[label]) for label in labels] for candidate in candidates]
+    matrix = np.asarray(candidates, dtype=np.float64).reshape(len(candidates), len(labels))
+    ids = [label_id(label) for label in labels]
+    n_candidates = len(matrix)
+
+    counts = np.zeros(n_candidates, dtype=np.int64)
+    masks = np.zeros((n_candidates, len(eggs)), dtype=bool) if return_masks else None
+    if not n_candidates or not labels:
+        return (counts, masks) if return_masks else counts
+
+    # ✅ Only labels inside some candidate's window can make an FN (small margin for the float formula)
+    values = eggs.values[:, ids].astype(np.float64)
+    lowest = matrix.min(axis=0)
+    highest = matrix.max(axis=0) * (1 + percentage / 100) * (1 + 1e-9)
+    in_band = (values > lowest) & (values <= highest)
+    labels_in_band = in_band.sum(axis=1)
+
+    # ✅ Eggs with one label in the band: FN exactly when that label is in the window → binary search per label
+    for j in range(len(labels)):
+        rows = np.flatnonzero((labels_in_band == 1) & in_band[:, j])
+        order = np.argsort(values[rows, j], kind="stable")
+        sorted_values = values[rows[order], j]
+        lower, upper = window_bounds(sorted_values, matrix[:, j], percentage)
+        counts += upper - lower
+        if return_masks:
+            for k in np.flatnonzero(upper > lower):
+                masks[k, rows[order[lower[k]:upper[k]]]] = True
+
+    # ✅ Eggs with several labels in the band: broadcast candidates × eggs × labels in bounded blocks
+    rows = np.flatnonzero(labels_in_band > 1)
+    values = values[rows]
+    candidate_chunk = max(1, min(n_candidates, chunk_elements // len(labels)))
+    row_chunk = max(1, chunk_elements // (candidate_chunk * len(labels)))
+    for k in range(0, n_candidates, candidate_chunk):
+        thresholds = matrix[k:k + candidate_chunk, None, :]
+        for start in range(0, len(rows), row_chunk):
+            deviation = ((values[None, start:start + row_chunk] - thresholds) / thresholds) * 100
+            is_fn = ((deviation > 0) & (deviation <= percentage)).any(axis=2)
+            counts[k:k + candidate_chunk] += is_fn.sum(axis=1)
+            if return_masks:
+                masks[k:k + candidate_chunk, rows[start:start + row_chunk]] = is_fn
+    return (counts, masks) if return_masks else counts
@@ -0,0 +1,283 @@
+import json
+from array import array
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from instrumentation import metrics
+from label_registry import LABEL_INDEX, LABELS, compile_profile
+
+
+class EggStore:
+    # ✅ Dense eggs × labels float32 matrix plus per-egg metadata
+    def __init__(self, values, max_deviation=None, source_line=None, source=None):
+        self.values = np.asarray(values, dtype=np.float32).reshape(-1, len(LABELS))
+        n_eggs = len(self.values)
+
+        # ✅ MaxDeviation is only present in extracted FN batches (NaN otherwise)
+        if max_deviation is None:
+            max_deviation = np.full(n_eggs, np.nan, dtype=np.float32)
+        self.max_deviation = np.asarray(max_deviation, dtype=np.float32)
+
+        # ✅ Line in the source file where each egg starts
+        if source_line is None:
+            source_line = np.arange(n_eggs, dtype=np.int64)
+        self.source_line = np.asarray(source_line, dtype=np.int64)
+
+        # ✅ JSONL path or content the eggs were parsed from (None if unknown), to write rows back unchanged
+        self.source = source
+
+    def __len__(self):
+        return len(self.values)
+
+    def column(self, label):
+        if label not in LABEL_INDEX:
+            return np.zeros(len(self), dtype=np.float32)
+        return self.values[:, LABEL_INDEX[label]]
+
+    def take(self, selection):
+        return EggStore(
+            self.values[selection],
+            self.max_deviation[selection],
+            self.source_line[selection],
+            self.source,
+        )
+
+    def to_egg_lists(self):
+        # ✅ Back to the sorter layout (one list of {"Label", "Value"} per egg)
+        for row in self.values.tolist():
+            yield [{"Label": label, "Value": value} for label, value in zip(LABELS, row)]
+
+    def source_records(self):
+        # ✅ Each egg as it was read from its source (flat label lines regrouped into one list),
+        #    so written batches keep the sorter's exact values; float32 rows when the source is unknown
+        if self.source is None:
+            yield from self.to_egg_lists()
+            return
+        content = self.source
+        if isinstance(content, str):
+            with open(content, "rb") as f:
+                content = f.read()
+        lines = [line for line in content.splitlines() if line.strip()]
+        for start in self.source_line.tolist():
+            record = json.loads(lines[start])
+            if isinstance(record, dict) and "Label" in record:
+                record = [json.loads(line) for line in lines[start:start + len(LABELS)]]
+            yield record
+
+
+def concat_eggs(stores):
+    # ✅ One store from several in order (a copy; the source is kept only when they all share it)
+    stores = list(stores)
+    if len(stores) == 1:
+        return stores[0]
+    if not stores:
+        return EggStore(np.empty((0, len(LABELS)), dtype=np.float32))
+    sources = {id(store.source) for store in stores}
+    return EggStore(
+        np.concatenate([store.values for store in stores]),
+        np.concatenate([store.max_deviation for store in stores]),
+        np.concatenate([store.source_line for store in stores]),
+        stores[0].source if len(sources) == 1 else None,
+    )
+
+
+def threshold_vector(thresholds):
+    # ✅ Threshold per label ID (inf = label not used) from a {label: threshold} dict or a compiled profile
+    if isinstance(thresholds, np.ndarray):
+        return thresholds
+    return compile_profile(thresholds).vector
+
+
+def parse_eggs(lines):
+    values = array("f")
+    max_deviation = array("f")
+    source_line = array("q")
+    row = [0.0] * len(LABELS)
+    flat_count = 0
+
+    # ✅ source_line counts records (non-blank lines), the same for raw lines and decoded records
+    line_number = -1
+    for line in lines:
+        if isinstance(line, (str, bytes)):
+            if not line.strip():
+                continue
+            record = json.loads(line)
+        else:
+            # ✅ Already decoded egg (in-memory dataset)
+            record = line
+        line_number += 1
+
+        if isinstance(record, list):
+            # ✅ Sorter layout: one list of {"Label", "Value"} dicts per egg
+            row = [0.0] * len(LABELS)
+            for item in record:
+                if isinstance(item, dict) and item.get("Label") in LABEL_INDEX:
+                    row[LABEL_INDEX[item["Label"]]] = item.get("Value", 0)
+            values.extend(row)
+            max_deviation.append(np.nan)
+            source_line.append(line_number)
+
+        elif "Label" in record:
+            # ✅ Flat layout: one label per line, regrouped into eggs of len(LABELS)
+            if flat_count == 0:
+                row = [0.0] * len(LABELS)
+                source_line.append(line_number)
+            if record["Label"] in LABEL_INDEX:
+                row[LABEL_INDEX[record["Label"]]] = record.get("Value", 0)
+            flat_count += 1
+            if flat_count == len(LABELS):
+                values.extend(row)
+                max_deviation.append(np.nan)
+                flat_count = 0
+
+        else:
+            # ✅ Translated FN batch: {"Blood": ..., ..., "MaxDeviation": ...}
+            row = [0.0] * len(LABELS)
+            for label, value in record.items():
+                if label in LABEL_INDEX:
+                    row[LABEL_INDEX[label]] = value
+            values.extend(row)
+            max_deviation.append(record.get("MaxDeviation", np.nan))
+            source_line.append(line_number)
+
+    # ✅ Trailing partial egg of a flat file
+    if flat_count:
+        values.extend(row)
+        max_deviation.append(np.nan)
+
+    return EggStore(
+        np.frombuffer(values, dtype=np.float32),
+        np.frombuffer(max_deviation, dtype=np.float32),
+        np.frombuffer(source_line, dtype=np.int64),
+    )
+
+
+class SharedEggs:
+    # ✅ EggStore in shared memory: pickles as a name, so pool workers and env copies attach without copying
+    def __init__(self, eggs):
+        eggs = load_eggs(eggs)
+        self.n_eggs = len(eggs)
+        self._shm = shared_memory.SharedMemory(create=True, size=max(1, self.n_eggs * (len(LABELS) + 1) * 4))
+        self.name = self._shm.name
+        self._owner = True
+        self._eggs = None
+        store = self.eggs()
+        store.values[:] = eggs.values
+        store.max_deviation[:] = eggs.max_deviation
+
+    def __getstate__(self):
+        return {"name": self.name, "n_eggs": self.n_eggs}
+
+    def __setstate__(self, state):
+        self.__dict__.update(state, _shm=None, _owner=False, _eggs=None)
+
+    def eggs(self):
+        # ✅ Read-only view for non-owners (attached once per process and handle)
+        if self._eggs is None:
+            if self._shm is None:
+                # ✅ Spawned workers share the creator's resource tracker, so only the owner unlinks
+                self._shm = shared_memory.SharedMemory(name=self.name)
+            width = len(LABELS)
+            values = np.ndarray((self.n_eggs, width), dtype=np.float32, buffer=self._shm.buf)
+            max_deviation = np.ndarray((self.n_eggs,), dtype=np.float32, buffer=self._shm.buf,
+                                       offset=self.n_eggs * width * 4)
+            if not self._owner:
+                values.flags.writeable = False
+                max_deviation.flags.writeable = False
+            self._eggs = EggStore(values, max_deviation)
+        return self._eggs
+
+    def close(self):
+        self._eggs = None
+        if self._shm is not None:
+            try:
+                self._shm.close()
+            except BufferError:
+                # ✅ A view is still referenced; the mapping goes away with it
+                pass
+            if self._owner:
+                self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def load_eggs(source):
+    # ✅ Accepts an EggStore, shared eggs, an eggs × labels array, a file path (JSONL or egg archive),
+    #    an open (uploaded) file or an iterable of decoded eggs
+    if isinstance(source, EggStore):
+        return source
+    if isinstance(source, SharedEggs):
+        return source.eggs()
+    if isinstance(source, np.ndarray):
+        return EggStore(source)
+    from egg_archive import ArchiveReader, is_archive
+    if is_archive(source):
+        # ✅ Memory-mapped, no parsing (all days of the archive in day order; several days are copied into
+        #    one matrix, egg_blocks gives per-day views instead)
+        return ArchiveReader(source).eggs()
+    with metrics.stage("parse"):
+        if isinstance(source, str):
+            with open(source, "rb") as f:
+                eggs = parse_eggs(f)
+            eggs.source = source
+            return eggs
+        return parse_eggs(source)
+
+
+def egg_blocks(source):
+    # ✅ The eggs of any load_eggs source in order, as EggStore blocks: one zero-copy view per day of an
+    #    egg archive (scans skip the concatenated copy of all days), the whole store otherwise
+    from egg_archive import ArchiveReader, is_archive
+    if is_archive(source):
+        for _, eggs in ArchiveReader(source).iter_days():
+            yield eggs
+    else:
+        yield load_eggs(source)
+
+
+def deviation_matrix(eggs, thresholds):
+    # ✅ Percentage above threshold per egg and used label (same formula as before)
+    vector = threshold_vector(thresholds)
+    used = np.isfinite(vector)
+    values = eggs.values[:, used].astype(np.float64)
+    return ((values - vector[used]) / vector[used]) * 100
+
+
+def _block_fn_mask(eggs, vector, percentage):
+    deviation = deviation_matrix(eggs, vector)
+    return ((deviation > 0) & (deviation <= percentage)).any(axis=1)
+
+
+def fn_mask(eggs, thresholds, percentage=1.0):
+    vector = threshold_vector(thresholds)
+    return np.concatenate([_block_fn_mask(block, vector, percentage) for block in egg_blocks(eggs)])
+
+
+def extract_fns(eggs, thresholds, percentage=1.0):
+    # ✅ Eggs with at least one label just above its threshold (0 < deviation <= percentage)
+    #    Archives are scanned day by day, so only the FN rows are copied
+    vector = threshold_vector(thresholds)
+    with metrics.stage("fn_extraction"):
+        return concat_eggs(block.take(_block_fn_mask(block, vector, percentage)) for block in egg_blocks(eggs))
+
+
+def _block_above_threshold(eggs, vector):
+    used = np.isfinite(vector)
+    return (eggs.values[:, used] > vector[used]).any(axis=1)
+
+
+def above_threshold_mask(eggs, thresholds):
+    # ✅ Eggs with at least one label strictly above its threshold
+    vector = threshold_vector(thresholds)
+    return np.concatenate([_block_above_threshold(block, vector) for block in egg_blocks(eggs)])
+
+
+def count_fns(eggs, thresholds, percentage=1.0):
+    vector = threshold_vector(thresholds)
+    return sum(int(_block_fn_mask(block, vector, percentage).sum()) for block in egg_blocks(eggs))
@@ -1,23 +1,23 @@
 import streamlit as st
-import json
+import numpy as np
+import pandas as pd
+from app_cache import cached_result, load_upload
+from egg_index import evaluate_candidates
+from label_registry import preset_thresholds
+from threshold_strategies import max_deviation_sweep
 # Preset Thresholds with Original Labels
-thresholds = {
-   "Blood": 80,
-   "Yolk": 120,
-   "Feces": 130,
-   "Bruised": 20,
-   "OpenCrack": 20,
-   "Crack": 175,
-   "Wrinkle": 6500,
-   "Feather": 100,
-   "CalciumSpot": 100,
-   "Dust": 150,
-   "Group_Dirty": 20,
-   "Group_Damaged": 20,
-   "Group_Schaalafwijking": 1000
-}
-# Adjustment Strategies: Increase by 25%, 50%, 75%, and 100% of MaxDeviation
-adjustment_strategies = [0.25, 0.5, 0.75, 1.0]
+thresholds = preset_thresholds()
+# Adjustment Strategies: fine grid of MaxDeviation percentages (step and range adjustable)
+strategy_step = st.sidebar.number_input("Strategy step (% of MaxDeviation)", min_value=0.1, max_value=25.0, value=1.0, step=0.1)
+strategy_range = st.sidebar.slider("Strategy range (% of MaxDeviation)", min_value=1, max_value=200, value=(1, 200))
+adjustment_strategies = np.round(np.arange(strategy_range[0], strategy_range[1] + strategy_step / 2, strategy_step) / 100, 4)
+# Sweep results cached by (upload hash, strategy grid)
+@cached_result
+def cached_sweep(digest, strategies, _data):
+   accepted, total, adjusted_max = max_deviation_sweep(_data, thresholds, np.array(strategies))
+   # Whole-egg 1% FNs left at every strategy's adjusted thresholds (all strategies in one batched pass)
+   remaining = evaluate_candidates(_data, adjusted_max, labels=list(thresholds))
+   return accepted, total, adjusted_max, remaining
 # Streamlit App Layout
 st.title("Threshold Adjustment Explorer for 1% FNs")
 st.write("Explore how much to adjust thresholds to accept 1% False Negatives (FNs).")
@@ -26,59 +26,54 @@ st.write("Adjustments are made by a percentage of MaxDeviation for each label.")
 uploaded_file = st.file_uploader("Upload 1% FN JSONL File", type="jsonl")
 # Process the file if uploaded
 if uploaded_file is not None:
-   data = []
-   # Read the JSONL File
+   # Read the JSONL File into the eggs × labels matrix
    try:
-       for line in uploaded_file:
-           egg = json.loads(line)
-           data.append(egg)
+       digest, data = load_upload(uploaded_file)
        st.success(f"Loaded {len(data)} eggs from the uploaded file.")
    except Exception as e:
        st.error(f"Error reading JSONL file: {e}")
        st.stop()
-   # Intelligent Exploration of Adjustments
+   # Intelligent Exploration of Adjustments (all labels and strategies in one vectorized sweep)
    st.subheader("Intelligent Exploration of Threshold Adjustments")
+   accepted, total, adjusted_max, remaining = cached_sweep(digest, tuple(adjustment_strategies.tolist()), data)
+   labels = list(thresholds.keys())
+   strategy_names = [f"{strategy * 100:g}%" for strategy in adjustment_strategies]
+   acceptance_rate = np.round(accepted / np.maximum(total, 1) * 100, 2)
+   # Find the Best Adjustment Strategy (first strategy with the highest acceptance rate)
+   best = acceptance_rate.argmax(axis=0)
    adjusted_thresholds = thresholds.copy()
-   for label, preset_threshold in thresholds.items():
-       st.markdown(f"### Adjustments for `{label}`")
-       st.write(f"Preset Threshold: `{preset_threshold}`")
-       # Check the 1% FNs for this label
-       fn_values = [egg.get(label, 0) for egg in data]
-       fn_values = [value for value in fn_values if value > 0]  # Only consider non-zero values
-       if not fn_values:
-           st.info(f"No FNs for `{label}`.")
+   summary = []
+   for i, label in enumerate(labels):
+       if total[i] == 0:
+           summary.append({"Label": label, "Preset Threshold": thresholds[label], "Total FNs": 0})
            continue
-       st.write(f"1% FNs for `{label}`: {fn_values}")
-       # Explore different adjustment strategies
-       strategy_results = []
-       for strategy in adjustment_strategies:
-           # Calculate Adjustment using MaxDeviation
-           adjusted_values = []
-           for egg in data:
-               max_deviation = egg.get("MaxDeviation", 0)
-               adjusted_threshold = round(preset_threshold + (max_deviation * strategy), 2)
-               adjusted_values.append(adjusted_threshold)
-           # Check how many FNs would be accepted with this adjustment
-           accepted_count = sum(1 for i, value in enumerate(fn_values) if value <= adjusted_values[i])
-           total_count = len(fn_values)
-           acceptance_rate = round((accepted_count / total_count) * 100, 2)
-           # Collect the results for display
-           strategy_results.append({
-               "Strategy": f"{int(strategy * 100)}% of MaxDeviation",
-               "Adjusted Thresholds": adjusted_values,
-               "FNs Accepted": accepted_count,
-               "Total FNs": total_count,
-               "Acceptance Rate": acceptance_rate
-           })
-       # Display Exploration Results
-       st.write(f"**Exploration Results for `{label}`:**")
-       for result in strategy_results:
-           st.write(f"- Strategy: `{result['Strategy']}`")
-           st.write(f"  - Adjusted Thresholds: `{result['Adjusted Thresholds']}`")
-           st.write(f"  - FNs Accepted: `{result['FNs Accepted']} / {result['Total FNs']} ({result['Acceptance Rate']}%)`")
-       # Find the Best Adjustment Strategy
-       best_strategy = max(strategy_results, key=lambda x: x['Acceptance Rate'])
-       adjusted_thresholds[label] = max(best_strategy["Adjusted Thresholds"])
+       adjusted_thresholds[label] = float(adjusted_max[best[i], i])
+       summary.append({
+           "Label": label,
+           "Preset Threshold": thresholds[label],
+           "Total FNs": int(total[i]),
+           "Best Strategy": f"{strategy_names[best[i]]} of MaxDeviation",
+           "FNs Accepted": int(accepted[best[i], i]),
+           "Acceptance Rate": acceptance_rate[best[i], i],
+           "Adjusted Threshold": adjusted_thresholds[label]
+       })
+   # Display Exploration Results
+   st.write("**Best strategy per label:**")
+   st.dataframe(pd.DataFrame(summary).set_index("Label"))
+   fn_labels = [label for i, label in enumerate(labels) if total[i] > 0]
+   if fn_labels:
+       st.write("**Acceptance curves (% of 1% FNs accepted vs. % of MaxDeviation):**")
+       curves = pd.DataFrame(acceptance_rate, index=adjustment_strategies * 100, columns=labels)[fn_labels]
+       curves.index.name = "% of MaxDeviation"
+       st.line_chart(curves)
+       with st.expander("Acceptance rate table"):
+           st.dataframe(curves)
+       st.write("**1% FNs left when every label uses the strategy's adjusted threshold:**")
+       remaining_curve = pd.DataFrame({"Remaining 1% FNs": remaining}, index=adjustment_strategies * 100)
+       remaining_curve.index.name = "% of MaxDeviation"
+       st.line_chart(remaining_curve)
+   else:
+       st.info("No FNs for any label.")
    # Display Adjusted Thresholds
    st.subheader("Adjusted Thresholds to Minimize 1% FNs")
-   st.json(adjusted_thresholds)
\ No newline at end of file
+   st.json(adjusted_thresholds)
@@ -1,76 +1,125 @@
+import argparse
 import json
-# Translation mapping for outlier region labels
-translation_map = {
-   "Bloed": "Blood",
-   "Eigeel": "Yolk",
-   "Mest": "Feces",
-   "Kneus": "Bruised",
-   "Openbreuk": "OpenCrack",
-   "Scheur": "Crack",
-   "Rimpel": "Wrinkle"
-   # "Veer": "Feather",
-   # "Kalkspot": "CalciumSpot",
-   # "Stof": "Dust",
-   # "groep_Vervuild": "Group_Dirty",
-   # "groep_Beschadigd": "Group_Damaged",
-   # "groep_Schaalafwijking": "Group_ShellDeviation"
-}
-# Thresholds for each label
-thresholds = {
-   "Blood": 80,
-   "Yolk": 120,
-   "Feces": 130,
-   "Bruised": 20,
-   "OpenCrack": 20,
-   "Crack": 175,
-   "Wrinkle": 6501,
-   "Feather": 199090,
-   "CalciumSpot": 999999,
-   "Dust": 999999,
-   "Group_Dirty": 999999,
-   "Group_Damaged": 999999,
-   "Group_ShellDeviation": 99999
-}
-# Function to calculate deviation percentage
-def calculate_deviation(value, threshold):
-   return ((value - threshold) / threshold) * 100
-# Initialize a list to hold the 1% FN training batch
-fn_1_percent_batch = []
-# File paths
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+from egg_archive import ArchiveReader, is_archive
+from label_registry import LABELS, TRANSLATION_MAP, compile_profile, preset_thresholds
+# Labels written to the FN batch, translated to their English names
+translation_map = {label: TRANSLATION_MAP[label] for label in ("Bloed", "Eigeel", "Mest", "Kneus", "Openbreuk", "Scheur", "Rimpel")}
+# Thresholds for each label (the sorter run uses 6501 for Wrinkle, the other labels keep their preset)
+thresholds = {**preset_thresholds(), "Wrinkle": 6501}
+# Default file paths
 input_file = '1_output.jsonl'
 output_file = '1st_step_new_threshold.jsonl'
-# Read and process the JSONL file line by line
-with open(input_file, 'r') as file:
+# Thresholds keyed by the original (untranslated) labels
+label_thresholds = {label: thresholds[translated_label] for label, translated_label in translation_map.items()}
+label_profile = compile_profile(label_thresholds)
+# Eggs per chunk handed to a worker
+chunk_size = 50000
+# Read the raw sorter log in chunks of whole eggs
+def read_chunks(file, chunk_eggs):
+   chunk = []
+   lines_per_egg = None
    for line in file:
-       # Parse the line as a list of dictionaries
-       egg = json.loads(line)
-       max_deviation = 0
-       is_1_percent_fn = False
-       # Translate labels and check against thresholds
-       translated_egg = {}
-       for item in egg:
-           label = item['Label']
-           value = item['Value']
-           translated_label = translation_map.get(label, label)
-           # Check if the translated label has a threshold
-           if translated_label in thresholds:
-               threshold = thresholds[translated_label]
-               deviation = calculate_deviation(value, threshold)
-               # Check if deviation is within 1%
-               if 0 < deviation <= 1:
-                   is_1_percent_fn = True
-                   if deviation > max_deviation:
-                       max_deviation = deviation
-               # Store the translated value
-               translated_egg[translated_label] = value
-       # If the egg is a 1% FN, add it to the batch
-       if is_1_percent_fn:
-           translated_egg['MaxDeviation'] = max_deviation
-           fn_1_percent_batch.append(translated_egg)
-# Save the 1% FN batch to a new JSONL file
-with open(output_file, 'w') as outfile:
-   for egg in fn_1_percent_batch:
-       json.dump(egg, outfile)
-       outfile.write('\n')
-print(f"1% FN Training batch created with {len(fn_1_percent_batch)} eggs.")
-print(f"File saved as {output_file}")
\ No newline at end of file
+       if not line.strip():
+           continue
+       if lines_per_egg is None:
+           # Flat layout (one label per line) takes len(LABELS) lines per egg
+           record = json.loads(line)
+           lines_per_egg = len(LABELS) if isinstance(record, dict) and 'Label' in record else 1
+       chunk.append(line)
+       if len(chunk) >= chunk_eggs * lines_per_egg:
+           yield chunk
+           chunk = []
+   if chunk:
+       yield chunk
+# Split an egg archive into (day, start, stop) ranges; workers map the file themselves
+def archive_chunks(path, chunk_eggs):
+   reader = ArchiveReader(path)
+   for day in reader.days:
+       n_eggs = len(reader.day(day))
+       for start in range(0, n_eggs, chunk_eggs):
+           yield day, start, start + chunk_eggs
+# Decode a chunk into {label: value} of the translated labels, values exactly as the sorter wrote them
+def decode_chunk(lines):
+   eggs = []
+   egg = {}
+   flat_count = 0
+   for line in lines:
+       if not line.strip():
+           continue
+       record = json.loads(line)
+       if isinstance(record, list):
+           eggs.append({item['Label']: item['Value'] for item in record if item.get('Label') in translation_map})
+           continue
+       # Flat layout: one label per line, regrouped into eggs of len(LABELS) lines
+       if record.get('Label') in translation_map:
+           egg[record['Label']] = record.get('Value', 0)
+       flat_count += 1
+       if flat_count == len(LABELS):
+           eggs.append(egg)
+           egg = {}
+           flat_count = 0
+   if flat_count:
+       eggs.append(egg)
+   return eggs
+# Find the 1% FN eggs of one chunk and return them as output lines
+def process_chunk(lines, percentage=1.0):
+   eggs = decode_chunk(lines)
+   values = np.array([[egg.get(label, 0) for label in label_profile.labels] for egg in eggs], dtype=np.float64)
+   return fn_lines(values.reshape(-1, len(label_profile)), percentage, eggs)
+def process_archive_chunk(path, day, start, stop, percentage=1.0):
+   # The archive stores float32 values, so these are written as stored
+   values = ArchiveReader(path).day(day, start, stop).values[:, label_profile.ids].astype(np.float64)
+   return fn_lines(values, percentage)
+def fn_lines(values, percentage=1.0, eggs=None):
+   # values: eggs × translated labels in float64; eggs: the decoded eggs, written back with their original values
+   deviation = ((values - label_profile.thresholds) / label_profile.thresholds) * 100
+   in_window = (deviation > 0) & (deviation <= percentage)
+   is_1_percent_fn = in_window.any(axis=1)
+   max_deviation = np.where(in_window, deviation, 0).max(axis=1, initial=0)
+   output_lines = []
+   for i in np.flatnonzero(is_1_percent_fn).tolist():
+       if eggs is not None:
+           translated_egg = {translation_map[label]: value for label, value in eggs[i].items()}
+       else:
+           translated_egg = dict(zip(translation_map.values(), values[i].tolist()))
+       translated_egg['MaxDeviation'] = float(max_deviation[i])
+       output_lines.append(json.dumps(translated_egg) + '\n')
+   return output_lines
+def extract_1_percent_fns(input_path, output_path, chunk_eggs=chunk_size, workers=None, percentage=1.0):
+   workers = workers or os.cpu_count() or 1
+   fn_count = 0
+   archive = is_archive(input_path)
+   with open(input_path, 'rb') as infile, open(output_path, 'w') as outfile, \
+           ProcessPoolExecutor(max_workers=workers) as pool:
+       # At most 2 chunks per worker in flight keeps memory bounded; results are written in input order
+       pending = deque()
+       if archive:
+           tasks = ((process_archive_chunk, input_path, *chunk) for chunk in archive_chunks(input_path, chunk_eggs))
+       else:
+           tasks = ((process_chunk, chunk) for chunk in read_chunks(infile, chunk_eggs))
+       for task in tasks:
+           pending.append(pool.submit(*task, percentage))
+           if len(pending) >= 2 * workers:
+               output_lines = pending.popleft().result()
+               outfile.writelines(output_lines)
+               fn_count += len(output_lines)
+       while pending:
+           output_lines = pending.popleft().result()
+           outfile.writelines(output_lines)
+           fn_count += len(output_lines)
+   return fn_count
+if __name__ == '__main__':
+   parser = argparse.ArgumentParser(description='Extract the 1% FN training batch from raw sorter output.')
+   parser.add_argument('input', nargs='?', default=input_file, help='raw sorter JSONL (list-per-line or one label per line) or egg archive')
+   parser.add_argument('output', nargs='?', default=output_file, help='1% FN batch JSONL to write')
+   parser.add_argument('--chunk-size', type=int, default=chunk_size, help='eggs per worker chunk')
+   parser.add_argument('--workers', type=int, default=None, help='worker processes (default: all cores)')
+   parser.add_argument('--percentage', type=float, default=1.0, help='FN window above the threshold in %% (default 1)')
+   args = parser.parse_args()
+   fn_count = extract_1_percent_fns(args.input, args.output, args.chunk_size, args.workers, args.percentage)
+   print(f"{args.percentage:g}% FN Training batch created with {fn_count} eggs.")
+   print(f"File saved as {args.output}")
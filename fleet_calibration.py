@@ -0,0 +1,157 @@
+import argparse
+import csv
+import glob
+import json
+import multiprocessing
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from calibration import DEFAULT_CONFIG, RESTARTS, calibrate_day
+from egg_archive import ArchiveReader, day_number
+from egg_store import load_eggs
+from label_registry import CALIBRATED_LABELS, ceilings, preset_thresholds
+
+# ✅ Per-machine results and the fleet summary are written here
+FLEET_OUTPUT_DIR = "fleet_results"
+
+
+def machine_days(machine_dir):
+    # ✅ [(day, loader)] in day order: days of an egg archive, else the JSONL day files (day number from the name)
+    archives = sorted(glob.glob(os.path.join(machine_dir, "*.eggs")))
+    if archives:
+        reader = ArchiveReader(archives[0])
+        return [(day, lambda day=day: reader.day(day)) for day in reader.days]
+
+    files = sorted(glob.glob(os.path.join(machine_dir, "*.jsonl")))
+    days = sorted((day_number(path, i + 1), path) for i, path in enumerate(files))
+    return [(day, lambda path=path: load_eggs(path)) for day, path in days]
+
+
+def find_machines(fleet_dir):
+    # ✅ One sub-directory per machine holding its day files
+    return sorted(
+        name for name in os.listdir(fleet_dir)
+        if os.path.isdir(os.path.join(fleet_dir, name)) and machine_days(os.path.join(fleet_dir, name))
+    )
+
+
+def calibrate_machine(machine, machine_dir, output_dir, thresholds, max_thresholds, config):
+    # ✅ The full day loop for one machine (runs in a pool worker)
+    started = time.time()
+    machine_dir = os.path.abspath(machine_dir)
+    machine_output = os.path.abspath(os.path.join(output_dir, machine))
+    os.makedirs(machine_output, exist_ok=True)
+
+    # ✅ Own registry per machine, and FN batches written in the machine's directory
+    config = {**config, "registry_dir": os.path.join(machine_output, "models"),
+              "fn_batch_dir": os.path.join(machine_output, "fn_batches")}
+    history = {
+        "machine": machine,
+        "days": [],
+        "thresholds": thresholds,
+        "threshold_history": {key: [value] for key, value in thresholds.items()},
+        "fn_counts": [],
+    }
+    try:
+        # ✅ Days are calibrated by position (the first one gets the day-1 step, as in the app and the job runner);
+        #    the file's day number only orders the days and labels them in the history
+        for position, (day, load_day) in enumerate(machine_days(machine_dir), start=1):
+            new_thresholds, fn_count = calibrate_day(position, load_day(), history["thresholds"], max_thresholds, config)
+            history["days"].append(day)
+            history["thresholds"] = new_thresholds
+            history["fn_counts"].append(fn_count)
+            for key, value in new_thresholds.items():
+                history["threshold_history"][key].append(value)
+        history["status"] = "done"
+    except Exception:
+        history["status"] = "failed"
+        history["error"] = traceback.format_exc()
+
+    history["seconds"] = round(time.time() - started, 2)
+    with open(os.path.join(machine_output, "history.json"), "w") as f:
+        json.dump(history, f, indent=2)
+    return history
+
+
+def summarize(histories, thresholds):
+    # ✅ One row per machine: FN counts over the run and the final threshold per label
+    rows = []
+    for history in sorted(histories, key=lambda history: history["machine"]):
+        fn_counts = history["fn_counts"]
+        row = {
+            "machine": history["machine"],
+            "status": history["status"],
+            "days": len(history["days"]),
+            "first_day_fns": fn_counts[0] if fn_counts else None,
+            "last_day_fns": fn_counts[-1] if fn_counts else None,
+            "total_fns": sum(fn_counts),
+            "seconds": history["seconds"],
+        }
+        for key in thresholds:
+            row[key] = history["thresholds"][key]
+        rows.append(row)
+    return rows
+
+
+def calibrate_fleet(fleet_dir, output_dir=FLEET_OUTPUT_DIR, thresholds=None, max_thresholds=None, config=None,
+                    workers=None):
+    thresholds = thresholds or preset_thresholds(CALIBRATED_LABELS)
+    max_thresholds = max_thresholds or ceilings(thresholds)
+    machines = find_machines(fleet_dir)
+    workers = workers or min(len(machines), os.cpu_count() or 1) or 1
+
+    # ✅ Split the cores between machines and the PPO restarts inside each machine
+    config = {**DEFAULT_CONFIG, **(config or {})}
+    if config["restart_workers"] is None:
+        config["restart_workers"] = max(1, min(RESTARTS, (os.cpu_count() or 1) // workers))
+
+    os.makedirs(output_dir, exist_ok=True)
+    histories = []
+    context = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = {
+            pool.submit(calibrate_machine, machine, os.path.join(fleet_dir, machine), output_dir,
+                        thresholds, max_thresholds, config): machine
+            for machine in machines
+        }
+        for future in as_completed(futures):
+            history = future.result()
+            histories.append(history)
+            print(f"{history['machine']}: {history['status']} after {len(history['days'])} days "
+                  f"in {history['seconds']}s, FN counts {history['fn_counts']}")
+
+    rows = summarize(histories, thresholds)
+    with open(os.path.join(output_dir, "summary.json"), "w") as f:
+        json.dump(rows, f, indent=2)
+    if rows:
+        with open(os.path.join(output_dir, "summary.csv"), "w", newline="") as f:
+            writer = csv.DictWriter(f, fieldnames=list(rows[0].keys()))
+            writer.writeheader()
+            writer.writerows(rows)
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Calibrate every machine of a fleet (one sub-directory of day files each).")
+    parser.add_argument("fleet_dir", help="directory with one sub-directory per machine (JSONL day files or an egg archive)")
+    parser.add_argument("--output", default=FLEET_OUTPUT_DIR, help="per-machine histories and summary.csv/json")
+    parser.add_argument("--workers", type=int, default=None, help="machines calibrated at once (default: all cores)")
+    parser.add_argument("--engine", choices=["ppo", "sweep"], default=DEFAULT_CONFIG["engine"])
+    parser.add_argument("--restart-workers", type=int, default=None, help="PPO restarts in parallel per machine")
+    parser.add_argument("--base-seed", type=int, default=DEFAULT_CONFIG["base_seed"])
+    parser.add_argument("--no-warm-start", action="store_true")
+    parser.add_argument("--metrics-dir", default=None)
+    args = parser.parse_args()
+
+    rows = calibrate_fleet(args.fleet_dir, args.output, workers=args.workers, config={
+        "engine": args.engine,
+        "restart_workers": args.restart_workers,
+        "base_seed": args.base_seed,
+        "warm_start": not args.no_warm_start,
+        "metrics_dir": os.path.abspath(args.metrics_dir) if args.metrics_dir else None,
+    })
+    failed = [row["machine"] for row in rows if row["status"] != "done"]
+    print(f"{len(rows)} machines calibrated, summary saved in {args.output}"
+          + (f" ({len(failed)} failed: {', '.join(failed)})" if failed else ""))
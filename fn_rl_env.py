@@ -1,44 +1,68 @@
 import gymnasium as gym
 import numpy as np
-import jsonlines
+from egg_store import above_threshold_mask, egg_blocks
+from instrumentation import metrics
+from label_registry import compile_profile
 
 class FNThresholdEnv(gym.Env):
     def __init__(self, fn_file, thresholds, max_thresholds):
         super(FNThresholdEnv, self).__init__()
 
-        # ✅ Load FN data
-        self.fn_data = []
-        with jsonlines.open(fn_file, "r") as reader:
-            for line in reader:
-                self.fn_data.append(line)
+        # ✅ Load FN data (eggs × labels blocks: one view per day of an egg archive, never concatenated)
+        self.fn_blocks = list(egg_blocks(fn_file))
+        self.n_eggs = sum(len(block) for block in self.fn_blocks)
 
-        # ✅ Store initial thresholds & allow decimal values
-        self.thresholds = {key: float(value) for key, value in thresholds.items()}
-        self.current_thresholds = self.thresholds.copy()
+        # ✅ Store initial thresholds & allow decimal values (compiled to label IDs and arrays)
+        self.profile = compile_profile(thresholds, max_thresholds)
+        self.thresholds = self.profile.to_dict()
+        self.labels = list(self.profile.labels)
+        self._initial = self.profile.thresholds.copy()
+        self._current = self._initial.copy()
 
         # ✅ Set Maximum Ceiling (Passed as Argument)
-        self.threshold_ceiling = max_thresholds.copy()
+        self.threshold_ceiling = self.profile.to_dict(self.profile.ceilings)
+        self._ceiling = self.profile.ceilings
+
+        # ✅ Per-label sorted values (and the eggs they belong to) for binary search
+        self._sorted_values = []
+        self._sorted_eggs = []
+        for label_id in self.profile.ids:
+            column = np.concatenate([block.values[:, label_id] for block in self.fn_blocks], dtype=np.float64)
+            order = np.argsort(column, kind="stable")
+            self._sorted_values.append(column[order])
+            self._sorted_eggs.append(order)
 
         # ✅ Observation space: Threshold values + FN count
         self.observation_space = gym.spaces.Box(
-            low=0, high=10000, shape=(len(thresholds) + 1,), dtype=np.float32  
+            low=0, high=10000, shape=(len(thresholds) + 1,), dtype=np.float32
         )
 
         # ✅ Action space: Allow decimal adjustments (-1 to +2)
         self.action_space = gym.spaces.Box(
-            low=-1, high=2, shape=(len(thresholds),), dtype=np.float32  
+            low=-1, high=2, shape=(len(thresholds),), dtype=np.float32
         )
 
         # ✅ Track previous FN count
+        self._reset_fn_state()
         self.previous_fn_count = self._calculate_fn_count()
 
-    def step(self, action):
-        label_list = list(self.current_thresholds.keys())
+    @property
+    def current_thresholds(self):
+        return dict(zip(self.labels, self._current.tolist()))
 
+    def step(self, action):
         # ✅ Apply controlled threshold updates (+2 max per step, decimals allowed)
-        for i, change in enumerate(action):
-            new_value = self.current_thresholds[label_list[i]] + min(max(-1, change), 2)  
-            self.current_thresholds[label_list[i]] = min(new_value, self.threshold_ceiling[label_list[i]])  
+        change = np.clip(np.asarray(action, dtype=np.float64), -1, 2)
+        new_thresholds = np.minimum(self._current + change, self._ceiling)
+
+        # ✅ Update the FN count from the labels whose threshold actually moved
+        moved = np.flatnonzero(new_thresholds != self._current)
+        for i in moved:
+            self._move_threshold(i, new_thresholds[i])
+        if metrics.enabled:
+            metrics.count("env_steps")
+            metrics.count("fn_evaluations")
+            metrics.count("label_updates", len(moved))
 
         # ✅ Calculate new FN count
         new_fn_count = self._calculate_fn_count()
@@ -50,46 +74,67 @@ class FNThresholdEnv(gym.Env):
             fn_reduction_percentage = 0
 
         # ✅ Reward = FN reduction percentage
-        reward = fn_reduction_percentage  
+        reward = fn_reduction_percentage
 
         # ✅ Strong penalty if FN count increases
         if new_fn_count > self.previous_fn_count:
-            reward -= 5  
+            reward -= 5
 
         # ✅ Additional Penalty if hitting the Ceiling
-        for key, value in self.current_thresholds.items():
-            if value >= self.threshold_ceiling[key]:
-                reward -= 2  
+        reward -= 2 * int(np.count_nonzero(self._current >= self._ceiling))
 
         # ✅ Store new FN count
         self.previous_fn_count = new_fn_count
 
         # ✅ Observation: Threshold values + FN count
-        observation = np.array(list(self.current_thresholds.values()) + [new_fn_count], dtype=np.float32)
+        observation = np.append(self._current, new_fn_count).astype(np.float32)
 
-        return observation, reward, False, False, {}
+        # ✅ Info: FN count and whether every threshold sits at its ceiling (read by the early-stopping callback)
+        at_ceiling = bool(np.all(self._current >= self._ceiling))
+        return observation, reward, False, False, {"fn_count": new_fn_count, "at_ceiling": at_ceiling}
 
     def reset(self, seed=None, options=None):
-        self.current_thresholds = self.thresholds.copy()
+        self._current = self._initial.copy()
+        self._reset_fn_state()
         initial_fn_count = self._calculate_fn_count()
-        self.previous_fn_count = initial_fn_count  
+        self.previous_fn_count = initial_fn_count
 
-        observation = np.array(list(self.current_thresholds.values()) + [initial_fn_count], dtype=np.float32)
+        observation = np.append(self._current, initial_fn_count).astype(np.float32)
         return observation, {}
 
-    def _calculate_fn_count(self):
-        fn_count = 0
+    def _reset_fn_state(self):
+        # ✅ Number of labels above threshold per egg (an egg is an FN while this is > 0)
+        self._firing_labels = np.zeros(self.n_eggs, dtype=np.int32)
+        for i, sorted_values in enumerate(self._sorted_values):
+            start = np.searchsorted(sorted_values, self._current[i], side="right")
+            self._firing_labels[self._sorted_eggs[i][start:]] += 1
+        self._fn_count = int(np.count_nonzero(self._firing_labels))
+        if metrics.enabled:
+            metrics.count("fn_evaluations")
+
+    def _move_threshold(self, i, new_threshold):
+        sorted_values = self._sorted_values[i]
+        old_start = np.searchsorted(sorted_values, self._current[i], side="right")
+        new_start = np.searchsorted(sorted_values, new_threshold, side="right")
+
+        if new_start > old_start:
+            # ✅ Threshold went up: these eggs no longer fire on this label
+            eggs = self._sorted_eggs[i][old_start:new_start]
+            self._firing_labels[eggs] -= 1
+            self._fn_count -= int(np.count_nonzero(self._firing_labels[eggs] == 0))
+        elif new_start < old_start:
+            # ✅ Threshold went down: these eggs start firing on this label
+            eggs = self._sorted_eggs[i][new_start:old_start]
+            self._fn_count += int(np.count_nonzero(self._firing_labels[eggs] == 0))
+            self._firing_labels[eggs] += 1
+
+        self._current[i] = new_threshold
 
-        for egg_list in self.fn_data:  # ✅ Each `egg_list` is a list of dictionaries
-            for egg in egg_list:  # ✅ Now loop over individual dictionaries
-                if isinstance(egg, dict):  # ✅ Ensure it's a dictionary
-                    label = egg.get("Label")
-                    value = egg.get("Value", 0)
-
-                    if label in self.current_thresholds:
-                        threshold = self.current_thresholds[label]
-                        if value > threshold:
-                            fn_count += 1  # ✅ Count only once per egg
-                            break  # ✅ Stop checking further labels for this egg (to avoid double-counting)
+    def _calculate_fn_count(self):
+        # ✅ Each egg counts once if any of its labels is above the current threshold
+        return self._fn_count
 
-        return fn_count
+    def _full_fn_count(self):
+        # ✅ Reference full rescan (same result as the incremental count)
+        vector = self.profile.with_thresholds(self._current).vector
+        return sum(int(above_threshold_mask(block, vector).sum()) for block in self.fn_blocks)
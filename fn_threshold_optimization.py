@@ -1,41 +1,37 @@
+import os
 import streamlit as st
-import jsonlines
 import numpy as np
 import matplotlib.pyplot as plt
-from stable_baselines3 import PPO
-from fn_rl_env import FNThresholdEnv  
-
-# ✅ Initial Thresholds
-thresholds = {
-    "Bloed": 80.0,
-    "Eigeel": 120.0,
-    "Mest": 130.0,
-    "Kneus": 20.0,
-    "Openbreuk": 20.0,
-    "Scheur": 175.0,
-}
+from app_cache import load_day_uploads
+from calibration import FINETUNE_TIMESTEPS, RESTARTS
+from calibration_jobs import find_job, is_running, read_progress, read_state, running_jobs, stop_job, submit_job
+from day_ingest import problem_report
+from label_registry import CALIBRATED_LABELS, DAILY_CAP, ceilings, preset_thresholds
+
+# ✅ Initial Thresholds (presets of the calibrated labels)
+thresholds = preset_thresholds(CALIBRATED_LABELS)
 
 # ✅ Define Max Thresholds (+20% Ceiling)
-max_thresholds = {key: round(value * 1.2, 2) for key, value in thresholds.items()}
-
-# ✅ Store Threshold History for Visualization
-threshold_history = {key: [value] for key, value in thresholds.items()}
-
-# ✅ Function to Extract FNs
-def extract_fns(file_path, thresholds, percentage=1.0):
-    fns = []
-    with jsonlines.open(file_path, "r") as reader:
-        for egg_list in reader:
-            for egg in egg_list:
-                label = egg.get("Label")
-                value = egg.get("Value", 0)
-                if label in thresholds:
-                    threshold = thresholds[label]
-                    deviation = ((value - threshold) / threshold) * 100
-                    if 0 < deviation <= percentage:
-                        fns.append(egg_list)
-                        break  
-    return fns
+max_thresholds = ceilings(thresholds)
+
+# ✅ Max Threshold Change per Day
+max_daily_change = DAILY_CAP
+
+# ✅ Live progress of the background calibration job (polled every 2 seconds)
+@st.fragment(run_every=2)
+def show_progress(job_dir, total_days):
+    state = read_state(job_dir)
+    for event in read_progress(job_dir):
+        st.write(f"📅 Day {event['day']} done in {event['seconds']}s. FN count: {event['fn_count']}, "
+                 f"thresholds: {event['thresholds']}")
+    st.progress(state.get("completed_day", 0) / total_days)
+    if state.get("status") == "failed":
+        st.error(f"Calibration job failed:\n{state.get('error')}")
+    elif state.get("status") == "done":
+        st.rerun()
+    elif not is_running(job_dir):
+        # ✅ Stopped (or its worker died): back to the page, which offers to resume it
+        st.rerun()
 
 # ✅ --- Streamlit UI Setup ---
 st.set_page_config(
@@ -49,6 +45,30 @@ st.sidebar.image("venco.png", use_container_width=True)
 st.sidebar.title("Egg Sorting Optimization")
 st.sidebar.info("Upload daily batch data to optimize egg sorting thresholds.")
 
+# ✅ Optimizer Engine (PPO or exact sweep over observed egg values)
+engine = st.sidebar.selectbox("Optimizer engine", ["PPO", "Exact sweep"])
+
+# ✅ Training Settings (parallel env copies for PPO rollouts)
+n_envs = st.sidebar.number_input("Parallel environments", min_value=1, max_value=64, value=1)
+vec_env = st.sidebar.selectbox("Environment mode", ["dummy", "subproc"],
+                               help="dummy: in-process copies, subproc: one process per copy")
+restart_workers = st.sidebar.number_input("Parallel restarts", min_value=1, max_value=64,
+                                          value=min(RESTARTS, os.cpu_count() or 1))
+base_seed = st.sidebar.number_input("Random seed", min_value=0, value=0, step=1)
+warm_start = st.sidebar.checkbox("Warm-start from previous day's policy", value=True)
+finetune_timesteps = st.sidebar.number_input("Fine-tune timesteps", min_value=256, max_value=5000,
+                                             value=FINETUNE_TIMESTEPS, step=256,
+                                             help="Below 2048 PPO trains one rollout of this size; above it, whole "
+                                                  "2048-step rollouts (rounded up)")
+save_fn_batch = st.sidebar.checkbox("Save daily FN batch files", value=True,
+                                    help="fn_training_day{day}.jsonl in the job's fn_batches directory, with the uploaded values "
+                                         "(training reads from memory)")
+early_stopping = st.sidebar.checkbox("Stop training early", value=True,
+                                     help="End a restart once FNs reach zero, stop improving or all thresholds hit the ceiling, "
+                                          "and skip the remaining restarts after a zero-FN candidate")
+record_metrics = st.sidebar.checkbox("Record stage metrics", value=False,
+                                     help="Stage timings and counters in logs/metrics (JSONL and TensorBoard)")
+
 # ✅ Main Section Title
 st.title("🐔 Meggsius Select Automatic Calibration")
 st.markdown("""
@@ -70,70 +90,65 @@ st.info("""
 """)
 
 # ✅ File Upload Section
-uploaded_files = st.file_uploader("Upload 16 JSONL Files", type="jsonl", accept_multiple_files=True)
-
-if uploaded_files and len(uploaded_files) == 16:
-    file_paths = []
-    for i, uploaded_file in enumerate(uploaded_files):
-        file_path = f"day_{i+1}.jsonl"
-        with open(file_path, "wb") as f:
-            f.write(uploaded_file.getbuffer())
-        file_paths.append(file_path)
-
-    current_thresholds = thresholds.copy()
-    fn_counts = []
-
-    for day in range(1, 17):
-        st.subheader(f"📅 Processing Day {day}...")
-
-        fns_day = extract_fns(file_paths[day-1], current_thresholds, percentage=1.0)
-        fn_counts.append(len(fns_day))
-
-        # ✅ Store Preset Thresholds Before RL Adjustment
-        old_thresholds = current_thresholds.copy()
-
-        if day == 1:
-            # ✅ Day 1: Increase Thresholds by 1% (Initial Step)
-            for key in current_thresholds.keys():
-                current_thresholds[key] = round(current_thresholds[key] * 1.01, 2)  
-        else:
-            best_thresholds = None
-            best_fn_count = float('inf')
-
-            for _ in range(10):
-                fn_file = f"fn_training_day{day}.jsonl"
-                with jsonlines.open(fn_file, "w") as writer:
-                    for egg_list in fns_day:
-                        writer.write(egg_list)
-
-                env = FNThresholdEnv(fn_file, current_thresholds, max_thresholds)  
-                model = PPO("MlpPolicy", env, verbose=1)
-                model.learn(total_timesteps=5000)
-
-                obs, _ = env.reset()
-                for _ in range(10):
-                    action, _ = model.predict(obs)
-                    obs, reward, terminated, truncated, info = env.step(action)
-                    if terminated or truncated:
-                        obs, _ = env.reset()
-
-                candidate_thresholds = {key: float(obs[i]) for i, key in enumerate(current_thresholds.keys())}
-                candidate_fn_count = len(extract_fns(file_paths[day-1], candidate_thresholds, percentage=1.0))
-
-                if candidate_fn_count < best_fn_count:
-                    best_fn_count = candidate_fn_count
-                    best_thresholds = candidate_thresholds
-
-            # ✅ Limit Max Threshold Change per Day (+1.0 max)
-            for key in best_thresholds.keys():
-                best_thresholds[key] = round(min(best_thresholds[key], current_thresholds[key] + 1.0), 2)
-
-            current_thresholds = best_thresholds.copy()
-            st.write(f"New RL-Optimized Thresholds for Day {day}: {best_thresholds}")
-
-        # ✅ Store Thresholds for Graphs
-        for key in current_thresholds.keys():
-            threshold_history[key].append(current_thresholds[key])
+uploaded_files = st.file_uploader("Upload daily JSONL files (or a zip/tar archive of them)",
+                                  type=["jsonl", "zip", "tar", "gz", "tgz"], accept_multiple_files=True)
+
+if uploaded_files:
+    # ✅ Parse and check every day up front (in parallel, no temp files); days ordered by the number in the name
+    with st.spinner("Reading day files..."):
+        days = load_day_uploads(uploaded_files)
+    problems = problem_report(days)
+    if problems:
+        st.error("Some day files have bad records. Fix them and upload again:\n\n"
+                 + "\n".join(f"- {problem}" for problem in problems))
+        st.stop()
+    if not days:
+        st.warning("No day files (.jsonl) found in the upload.")
+        st.stop()
+    st.success(f"{len(days)} days loaded: " + ", ".join(day["name"] for day in days))
+    day_data = [(day["digest"], day["eggs"]) for day in days]
+    n_days = len(day_data)
+
+    config = {
+        "engine": "sweep" if engine == "Exact sweep" else "ppo",
+        "n_envs": int(n_envs),
+        "vec_env": vec_env,
+        "restart_workers": int(restart_workers),
+        "base_seed": int(base_seed),
+        "daily_cap": max_daily_change,
+        "warm_start": warm_start,
+        "finetune_timesteps": int(finetune_timesteps),
+        "save_fn_batch": save_fn_batch,
+        "early_stopping": early_stopping,
+        "skip_restarts": early_stopping,
+        "metrics_dir": os.path.abspath(os.path.join("logs", "metrics")) if record_metrics else None,
+    }
+
+    # ✅ The day loop runs as a background job, started only from the button (changing a setting starts
+    #    nothing); results are checkpointed after each day, so a stopped job resumes from its last finished day
+    job_dir = find_job(day_data, thresholds, config)
+    state = read_state(job_dir)
+    if state.get("status") != "done":
+        st.subheader("📅 Processing Days...")
+        if is_running(job_dir):
+            if st.button("Stop calibration"):
+                stop_job(job_dir)
+                st.rerun()
+            show_progress(job_dir, n_days)
+            st.stop()
+
+        if state.get("status") == "failed":
+            st.error(f"Calibration job failed:\n{state.get('error')}")
+        if running_jobs([digest for digest, _ in day_data]):
+            st.info("A calibration with other settings is running on these files. Starting this one stops it.")
+        if st.button("Resume calibration" if state else "Start calibration", type="primary"):
+            submit_job(day_data, thresholds, max_thresholds, config)
+            st.rerun()
+        st.stop()
+
+    current_thresholds = state["thresholds"]
+    fn_counts = state["fn_counts"]
+    threshold_history = state["threshold_history"]
 
     # ✅ 📈 Graph: Threshold Adjustments Over Time
     st.subheader("📊 Threshold Adjustments Over Time")
@@ -147,21 +162,21 @@ if uploaded_files and len(uploaded_files) == 16:
     st.pyplot(plt)
 
     # ✅ 📊 Final FN Reduction Over Time
-    st.subheader("📉 Final FN Reduction Over 16 Days")
+    st.subheader(f"📉 Final FN Reduction Over {n_days} Days")
     plt.figure(figsize=(10, 5))
     plt.plot(range(1, len(fn_counts) + 1), fn_counts, marker='o', linestyle='-', color="red")
     plt.xlabel("Day")
     plt.ylabel("FN Count")
-    plt.title("False Negatives Reduction Over 16 Days")
+    plt.title(f"False Negatives Reduction Over {n_days} Days")
     st.pyplot(plt)
 
-    # ✅ 📊 Final FN & Threshold Comparison (Day 1 vs Day 16)
-    st.subheader("📊 Day 1 vs Day 16 Comparison")
+    # ✅ 📊 Final FN & Threshold Comparison (Day 1 vs last day)
+    st.subheader(f"📊 Day 1 vs Day {n_days} Comparison")
 
     # ✅ FN Count Comparison
     col1, col2 = st.columns(2)
     col1.metric(label="FN Count on Day 1", value=fn_counts[0])
-    col2.metric(label="FN Count on Day 16", value=fn_counts[-1])
+    col2.metric(label=f"FN Count on Day {n_days}", value=fn_counts[-1])
 
     # ✅ Threshold Comparison Table
     final_thresholds = {key: current_thresholds[key] for key in thresholds.keys()}
@@ -0,0 +1,99 @@
+import json
+import os
+import resource
+import time
+from contextlib import contextmanager, nullcontext
+
+# ✅ Metrics are on when this points at a log directory (inherited by worker processes)
+METRICS_ENV = "FN_METRICS_DIR"
+
+_NULL_STAGE = nullcontext()
+
+
+class Metrics:
+    # ✅ Per-stage latency and counters, flushed to a JSONL log and TensorBoard
+    def __init__(self, log_dir=None):
+        self.log_dir = log_dir
+        self.enabled = log_dir is not None
+        self._stage_seconds = {}
+        self._stage_calls = {}
+        self._counters = {}
+        self._writer = None
+
+    def stage(self, name):
+        # ✅ Shared no-op context when disabled
+        if not self.enabled:
+            return _NULL_STAGE
+        return self._timed(name)
+
+    @contextmanager
+    def _timed(self, name):
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self._stage_seconds[name] = self._stage_seconds.get(name, 0.0) + time.perf_counter() - started
+            self._stage_calls[name] = self._stage_calls.get(name, 0) + 1
+
+    def count(self, name, amount=1):
+        if self.enabled:
+            self._counters[name] = self._counters.get(name, 0) + amount
+
+    def _tensorboard(self):
+        if self._writer is None:
+            try:
+                from torch.utils.tensorboard import SummaryWriter
+                self._writer = SummaryWriter(self.log_dir, filename_suffix=f".{os.getpid()}")
+            except ImportError:
+                self._writer = False
+        return self._writer
+
+    def flush(self, step, scope="calibration"):
+        if not self.enabled or not (self._stage_seconds or self._counters):
+            return None
+
+        # ✅ Throughput over the time spent training (where the env is stepped)
+        training_seconds = self._stage_seconds.get("model_learn", 0.0) + self._stage_seconds.get("propose_thresholds", 0.0)
+        rates = {}
+        if training_seconds:
+            rates["env_steps_per_sec"] = self._counters.get("env_steps", 0) / training_seconds
+            rates["fn_evaluations_per_sec"] = self._counters.get("fn_evaluations", 0) / training_seconds
+
+        record = {
+            "time": time.time(),
+            "pid": os.getpid(),
+            "scope": scope,
+            "step": step,
+            "stage_seconds": self._stage_seconds,
+            "stage_calls": self._stage_calls,
+            "counters": self._counters,
+            "rates": rates,
+            "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+        }
+        os.makedirs(self.log_dir, exist_ok=True)
+        with open(os.path.join(self.log_dir, "metrics.jsonl"), "a") as f:
+            f.write(json.dumps(record) + "\n")
+
+        writer = self._tensorboard()
+        if writer:
+            for name, seconds in self._stage_seconds.items():
+                writer.add_scalar(f"{scope}/stage/{name}_seconds", seconds, step)
+            for name, value in rates.items():
+                writer.add_scalar(f"{scope}/rate/{name}", value, step)
+            writer.add_scalar(f"{scope}/memory/peak_rss_mb", record["peak_rss_mb"], step)
+            writer.flush()
+
+        self._stage_seconds = {}
+        self._stage_calls = {}
+        self._counters = {}
+        return record
+
+
+def enable_metrics(log_dir):
+    # ✅ Turn metrics on for this process and every worker it starts
+    os.environ[METRICS_ENV] = log_dir
+    metrics.log_dir = log_dir
+    metrics.enabled = True
+
+
+metrics = Metrics(os.environ.get(METRICS_ENV) or None)
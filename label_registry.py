@@ -0,0 +1,110 @@
+import numpy as np
+
+# ✅ Fixed label order of the Meggsius Select output (label ID = position)
+LABELS = (
+    "Bloed",
+    "Eigeel",
+    "Mest",
+    "Kneus",
+    "Openbreuk",
+    "Scheur",
+    "Rimpel",
+    "Veer",
+    "Kalkspot",
+    "Stof",
+    "groep_Vervuild",
+    "groep_Beschadigd",
+    "groep_Schaalafwijking",
+)
+
+# ✅ English names used by the analysis tools (extractFN output, FN batches)
+TRANSLATION_MAP = {
+    "Bloed": "Blood",
+    "Eigeel": "Yolk",
+    "Mest": "Feces",
+    "Kneus": "Bruised",
+    "Openbreuk": "OpenCrack",
+    "Scheur": "Crack",
+    "Rimpel": "Wrinkle",
+    "Veer": "Feather",
+    "Kalkspot": "CalciumSpot",
+    "Stof": "Dust",
+    "groep_Vervuild": "Group_Dirty",
+    "groep_Beschadigd": "Group_Damaged",
+    "groep_Schaalafwijking": "Group_ShellDeviation",
+}
+
+ENGLISH_LABELS = tuple(TRANSLATION_MAP[label] for label in LABELS)
+
+# ✅ Label ID for both Dutch and English label names
+LABEL_INDEX = {label: i for i, label in enumerate(LABELS)}
+LABEL_INDEX.update({label: i for i, label in enumerate(ENGLISH_LABELS)})
+
+# ✅ Preset sorter thresholds, one per label ID
+PRESET_THRESHOLDS = (80.0, 120.0, 130.0, 20.0, 20.0, 175.0, 6500.0, 100.0, 100.0, 150.0, 20.0, 20.0, 1000.0)
+
+# ✅ Labels the calibration loop adjusts
+CALIBRATED_LABELS = ("Bloed", "Eigeel", "Mest", "Kneus", "Openbreuk", "Scheur")
+
+# ✅ Ceiling above the preset (+20%) and max threshold change per day
+CEILING_FACTOR = 1.2
+DAILY_CAP = 1.0
+
+
+def label_id(label):
+    if label not in LABEL_INDEX:
+        raise KeyError(f"Unknown label {label!r} (expected one of {', '.join(LABELS + ENGLISH_LABELS)})")
+    return LABEL_INDEX[label]
+
+
+def preset_thresholds(labels=ENGLISH_LABELS):
+    # ✅ {label: preset threshold} keyed by the given (Dutch or English) names
+    return {label: PRESET_THRESHOLDS[label_id(label)] for label in labels}
+
+
+def ceilings(thresholds, factor=CEILING_FACTOR):
+    return {label: round(float(value) * factor, 2) for label, value in thresholds.items()}
+
+
+class ThresholdProfile:
+    # ✅ A {label: threshold} dict compiled once into label IDs and aligned float64 arrays
+    def __init__(self, labels, ids, thresholds, ceilings, daily_caps):
+        self.labels = tuple(labels)
+        self.ids = ids
+        self.thresholds = thresholds
+        self.ceilings = ceilings
+        self.daily_caps = daily_caps
+
+        # ✅ Threshold per label ID (inf = label not in the profile, never above threshold)
+        self.vector = np.full(len(LABELS), np.inf)
+        self.vector[ids] = thresholds
+
+    def __len__(self):
+        return len(self.labels)
+
+    def to_dict(self, values=None):
+        # ✅ Back to {label: value} with the caller's label names (the profile thresholds by default)
+        values = self.thresholds if values is None else values
+        return dict(zip(self.labels, np.asarray(values, dtype=np.float64).tolist()))
+
+    def with_thresholds(self, values):
+        return ThresholdProfile(self.labels, self.ids, np.asarray(values, dtype=np.float64),
+                                self.ceilings, self.daily_caps)
+
+
+def compile_profile(thresholds, max_thresholds=None, daily_cap=DAILY_CAP):
+    # ✅ Unknown labels raise instead of being silently ignored; ceilings default to +20%
+    if isinstance(thresholds, ThresholdProfile):
+        return thresholds
+    labels = list(thresholds.keys())
+    ids = np.array([label_id(label) for label in labels], dtype=np.intp)
+    if len(set(ids.tolist())) != len(ids):
+        raise ValueError(f"Thresholds name the same label twice (Dutch and English): {labels}")
+
+    values = np.array([float(thresholds[label]) for label in labels])
+    max_thresholds = max_thresholds if max_thresholds is not None else ceilings(thresholds)
+    if isinstance(daily_cap, dict):
+        daily_caps = np.array([float(daily_cap[label]) for label in labels])
+    else:
+        daily_caps = np.full(len(labels), float(daily_cap))
+    return ThresholdProfile(labels, ids, values, np.array([float(max_thresholds[label]) for label in labels]), daily_caps)
@@ -0,0 +1,65 @@
+import hashlib
+import json
+import os
+
+# ✅ Local registry of the winning PPO policy per day
+REGISTRY_DIR = "models"
+
+
+class ModelRegistry:
+    # ✅ Layout: <root>/<label set key>/day_XX.zip (+ day_XX.json metadata, day_XX.npz NumPy policy, labels.json)
+    def __init__(self, root=REGISTRY_DIR):
+        self.root = root
+
+    def _label_dir(self, labels):
+        key = hashlib.sha1("|".join(labels).encode()).hexdigest()[:12]
+        return os.path.join(self.root, key)
+
+    def path(self, labels, day):
+        return os.path.join(self._label_dir(labels), f"day_{day:02d}.zip")
+
+    def policy_path(self, labels, day):
+        return os.path.join(self._label_dir(labels), f"day_{day:02d}.npz")
+
+    def save(self, labels, day, model_bytes, metadata=None, policy_bytes=None):
+        label_dir = self._label_dir(labels)
+        os.makedirs(label_dir, exist_ok=True)
+        with open(os.path.join(label_dir, "labels.json"), "w") as f:
+            json.dump(list(labels), f)
+
+        # ✅ Write to a temp file first so a crash never leaves a half-written model
+        path = self.path(labels, day)
+        with open(path + ".tmp", "wb") as f:
+            f.write(model_bytes)
+        os.replace(path + ".tmp", path)
+        if policy_bytes is not None:
+            policy_path = self.policy_path(labels, day)
+            with open(policy_path + ".tmp", "wb") as f:
+                f.write(policy_bytes)
+            os.replace(policy_path + ".tmp", policy_path)
+        with open(path[:-len(".zip")] + ".json", "w") as f:
+            json.dump({"day": day, **(metadata or {})}, f)
+        return path
+
+    def days(self, labels):
+        label_dir = self._label_dir(labels)
+        if not os.path.isdir(label_dir):
+            return []
+        return sorted(
+            int(name[len("day_"):-len(".zip")])
+            for name in os.listdir(label_dir)
+            if name.startswith("day_") and name.endswith(".zip")
+        )
+
+    def latest(self, labels, before_day=None):
+        # ✅ Most recent saved policy (optionally from a day before `before_day`), or None
+        days = [day for day in self.days(labels) if before_day is None or day < before_day]
+        return self.path(labels, days[-1]) if days else None
+
+    def latest_policy(self, labels, before_day=None):
+        # ✅ Most recent exported NumPy policy (loads without torch), or None
+        days = [
+            day for day in self.days(labels)
+            if (before_day is None or day < before_day) and os.path.exists(self.policy_path(labels, day))
+        ]
+        return self.policy_path(labels, days[-1]) if days else None
@@ -0,0 +1,80 @@
+import argparse
+import io
+
+import numpy as np
+
+# ✅ Activations of the SB3 MLP policies, by torch module name
+ACTIVATIONS = {
+    "Tanh": np.tanh,
+    "ReLU": lambda x: np.maximum(x, 0),
+}
+
+
+def export_policy(model, labels=None):
+    # ✅ Weights of a trained PPO policy as .npz bytes (needs torch, so only run where the model was trained)
+    policy = model.policy
+    state = {key: value.detach().cpu().numpy() for key, value in policy.state_dict().items()}
+    layers = sorted(
+        {int(key.split(".")[2]) for key in state if key.startswith("mlp_extractor.policy_net.")}
+    )
+    arrays = {
+        "activation": np.array(policy.activation_fn.__name__),
+        "action_weight": state["action_net.weight"],
+        "action_bias": state["action_net.bias"],
+        "log_std": state["log_std"],
+        "action_low": policy.action_space.low,
+        "action_high": policy.action_space.high,
+        "labels": np.array(labels or []),
+    }
+    for i, layer in enumerate(layers):
+        arrays[f"layer_{i}_weight"] = state[f"mlp_extractor.policy_net.{layer}.weight"]
+        arrays[f"layer_{i}_bias"] = state[f"mlp_extractor.policy_net.{layer}.bias"]
+
+    buffer = io.BytesIO()
+    np.savez(buffer, **arrays)
+    return buffer.getvalue()
+
+
+class NumpyPolicy:
+    # ✅ Torch-free stand-in for model.predict on FNThresholdEnv observations
+    def __init__(self, source, seed=None):
+        with np.load(source if isinstance(source, str) else io.BytesIO(source)) as weights:
+            self.layers = []
+            while f"layer_{len(self.layers)}_weight" in weights:
+                i = len(self.layers)
+                self.layers.append((weights[f"layer_{i}_weight"], weights[f"layer_{i}_bias"]))
+            self.activation = ACTIVATIONS[str(weights["activation"])]
+            self.action_weight = weights["action_weight"]
+            self.action_bias = weights["action_bias"]
+            self.std = np.exp(weights["log_std"])
+            self.action_low = weights["action_low"]
+            self.action_high = weights["action_high"]
+            self.labels = [str(label) for label in weights["labels"]]
+        self.rng = np.random.default_rng(seed)
+
+    def action_mean(self, observation):
+        hidden = np.asarray(observation, dtype=np.float32)
+        for weight, bias in self.layers:
+            hidden = self.activation(hidden @ weight.T + bias)
+        return hidden @ self.action_weight.T + self.action_bias
+
+    def predict(self, observation, state=None, episode_start=None, deterministic=False):
+        # ✅ Same contract as PPO.predict: Gaussian sample around the mean (or the mean), clipped to the action space
+        action = self.action_mean(observation)
+        if not deterministic:
+            action = action + self.std * self.rng.standard_normal(action.shape).astype(np.float32)
+        return np.clip(action, self.action_low, self.action_high), state
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Export a saved PPO policy (.zip) to a NumPy weight file (.npz).")
+    parser.add_argument("model", help="PPO model zip (e.g. models/<labels>/day_05.zip)")
+    parser.add_argument("output", help="NumPy policy file to write")
+    parser.add_argument("--labels", nargs="*", default=None, help="threshold labels the policy was trained on")
+    args = parser.parse_args()
+
+    from stable_baselines3 import PPO
+
+    with open(args.output, "wb") as f:
+        f.write(export_policy(PPO.load(args.model, device="cpu"), args.labels))
+    print(f"Policy saved as {args.output}")
@@ -0,0 +1,143 @@
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from egg_store import parse_eggs
+from label_registry import CALIBRATED_LABELS, DAILY_CAP, LABELS, ceilings, compile_profile, preset_thresholds
+from threshold_solver import GRID
+
+# ✅ Upper bound on histogram bins per label (memory stays fixed whatever the stream length)
+MAX_BINS = 4096
+
+
+class StreamingCalibrator:
+    # ✅ Per-label histograms of the near-threshold band, updated per egg; thresholds proposed from their cumsums
+    def __init__(self, thresholds, max_thresholds, daily_cap=DAILY_CAP, percentage=1.0, max_bins=MAX_BINS):
+        self.profile = compile_profile(thresholds, max_thresholds, daily_cap)
+        self.percentage = percentage
+        self.max_bins = max_bins
+        self.day = 0
+        self.eggs = 0
+        self.start_day(self.profile.thresholds)
+
+    def start_day(self, thresholds=None):
+        # ✅ New day: thresholds may move up to the daily cap (and never past the ceiling) from here
+        profile = self.profile
+        self.day += 1
+        self.day_start = np.asarray(self.thresholds if thresholds is None else thresholds, dtype=np.float64).copy()
+        self.thresholds = self.day_start.copy()
+        self.low = self.day_start
+        self.high = np.round(np.minimum(profile.ceilings, self.day_start + profile.daily_caps), 2)
+
+        # ✅ The band covers every window (t, t(1 + p)] with t in [low, high]
+        band_top = self.high * (1 + self.percentage / 100)
+        self.bins = np.clip(np.ceil(np.round((band_top - self.low) / GRID, 6)), 1, self.max_bins).astype(np.intp)
+        self.width = np.maximum((band_top - self.low) / self.bins, GRID)
+        self.offsets = np.concatenate([[0], np.cumsum(self.bins)[:-1]])
+        self.histogram = np.zeros(int(self.bins.sum()), dtype=np.int64)
+        self.day_eggs = 0
+
+    def update(self, values):
+        # ✅ values: one egg (labels,) or a batch (eggs × labels) in the EggStore column order
+        values = np.asarray(values, dtype=np.float64).reshape(-1, len(LABELS))[:, self.profile.ids]
+        index = np.floor(np.round((values - self.low) / self.width, 6)).astype(np.intp)
+        inside = (index >= 0) & (index < self.bins)
+        columns = np.broadcast_to(self.offsets, index.shape)
+        self.histogram += np.bincount((index + columns)[inside], minlength=len(self.histogram))
+        self.eggs += len(values)
+        self.day_eggs += len(values)
+
+    def _bin(self, values, i):
+        return np.floor(np.round((values - self.low[i]) / self.width[i], 6)).astype(np.intp)
+
+    def propose(self):
+        # ✅ Per label: the bin edge in [low, high] with the fewest eggs in its window (smallest on ties)
+        window_fns = np.zeros(len(self.profile), dtype=np.int64)
+        for i in range(len(self.profile)):
+            counts = self.histogram[self.offsets[i]:self.offsets[i] + self.bins[i]]
+            cumulative = np.concatenate([[0], np.cumsum(counts)])
+            candidates = np.round(np.arange(self.low[i], self.high[i] + GRID / 2, GRID), 2)
+            # ✅ Window (t, t(1 + p)] at bin resolution: from the bin holding t through the bin holding t(1 + p)
+            lower = np.clip(self._bin(candidates, i), 0, self.bins[i])
+            upper = np.clip(self._bin(candidates * (1 + self.percentage / 100), i) + 1, 0, self.bins[i])
+            fn_counts = cumulative[upper] - cumulative[lower]
+            best = int(np.argmin(fn_counts))
+            self.thresholds[i] = candidates[best]
+            window_fns[i] = fn_counts[best]
+        return self.profile.to_dict(self.thresholds), dict(zip(self.profile.labels, window_fns.tolist()))
+
+
+def read_batches(stream, batch_eggs, follow=False, poll_seconds=0.5):
+    # ✅ Lines grouped into whole eggs; with follow, waits for new lines (tail -f) and flushes what it has
+    lines = []
+    lines_per_egg = None
+    while True:
+        line = stream.readline()
+        if not line:
+            if lines:
+                yield lines
+                lines = []
+            if not follow:
+                return
+            time.sleep(poll_seconds)
+            continue
+        if not line.strip():
+            continue
+        if lines_per_egg is None:
+            record = json.loads(line)
+            lines_per_egg = len(LABELS) if isinstance(record, dict) and "Label" in record else 1
+        lines.append(line)
+        if len(lines) >= batch_eggs * lines_per_egg:
+            yield lines
+            lines = []
+
+
+def run_stream(stream, calibrator, emit_every=1000, day_eggs=None, batch_eggs=64, follow=False, output=sys.stdout):
+    # ✅ Emits a JSON line whenever the proposed thresholds change (checked every emit_every eggs)
+    last_emitted = None
+    next_emit = emit_every
+    today = time.strftime("%Y-%m-%d")
+    for lines in read_batches(stream, batch_eggs, follow):
+        calibrator.update(parse_eggs(lines).values)
+
+        # ✅ Day boundary: a fixed egg count (replays) or the calendar date (live)
+        new_day = (calibrator.day_eggs >= day_eggs) if day_eggs else (time.strftime("%Y-%m-%d") != today)
+        if calibrator.eggs >= next_emit or new_day:
+            next_emit = calibrator.eggs + emit_every
+            thresholds, window_fns = calibrator.propose()
+            if thresholds != last_emitted:
+                output.write(json.dumps({
+                    "day": calibrator.day,
+                    "eggs": calibrator.eggs,
+                    "thresholds": thresholds,
+                    "window_fns": window_fns,
+                }) + "\n")
+                output.flush()
+                last_emitted = thresholds
+        if new_day:
+            today = time.strftime("%Y-%m-%d")
+            calibrator.start_day()
+    return calibrator.profile.to_dict(calibrator.thresholds)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Adapt thresholds online from a stream of sorter eggs (JSONL).")
+    parser.add_argument("input", nargs="?", default="-", help="JSONL file or - for stdin")
+    parser.add_argument("--follow", action="store_true", help="keep reading as the file grows (like tail -f)")
+    parser.add_argument("--emit-every", type=int, default=1000, help="eggs between threshold updates")
+    parser.add_argument("--day-eggs", type=int, default=None, help="start a new day every N eggs (default: calendar date)")
+    parser.add_argument("--batch", type=int, default=64, help="eggs parsed per batch")
+    parser.add_argument("--daily-cap", type=float, default=DAILY_CAP)
+    args = parser.parse_args()
+
+    thresholds = preset_thresholds(CALIBRATED_LABELS)
+    calibrator = StreamingCalibrator(thresholds, ceilings(thresholds), args.daily_cap)
+    stream = sys.stdin if args.input == "-" else open(args.input)
+    try:
+        final = run_stream(stream, calibrator, args.emit_every, args.day_eggs, args.batch, args.follow)
+    except KeyboardInterrupt:
+        final = calibrator.profile.to_dict(calibrator.thresholds)
+    print(json.dumps({"final_thresholds": final}), file=sys.stderr)
@@ -0,0 +1,87 @@
+import glob
+import json
+import os
+
+import numpy as np
+import pytest
+
+from egg_store import count_fns, load_eggs
+from fn_rl_env import FNThresholdEnv
+from label_registry import CALIBRATED_LABELS, DAILY_CAP, ceilings, preset_thresholds
+from threshold_solver import solve_thresholds
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# ✅ The bundled daily FN batches (sorter layout, one egg list per line)
+DAY_FILES = sorted(glob.glob(os.path.join(ROOT, "fn_training_day[0-9]*.jsonl")))
+
+
+def read_records(path):
+    with open(path) as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def scan_above_threshold(records, thresholds):
+    # ✅ The original dict scan of the env: an egg counts once, on its first label above its threshold
+    fn_count = 0
+    for egg_list in records:
+        for egg in egg_list:
+            if isinstance(egg, dict):
+                label = egg.get("Label")
+                value = egg.get("Value", 0)
+                if label in thresholds and value > thresholds[label]:
+                    fn_count += 1
+                    break
+    return fn_count
+
+
+def scan_fns(records, thresholds, percentage=1.0):
+    # ✅ The original extractFN rule: an egg is an FN if any label is 0% < deviation <= percentage
+    fn_count = 0
+    for egg_list in records:
+        for egg in egg_list:
+            threshold = thresholds.get(egg["Label"])
+            if threshold is not None and 0 < (egg["Value"] - threshold) / threshold * 100 <= percentage:
+                fn_count += 1
+                break
+    return fn_count
+
+
+@pytest.fixture
+def thresholds():
+    return preset_thresholds(CALIBRATED_LABELS)
+
+
+def test_bundled_days_present():
+    assert DAY_FILES
+
+
+@pytest.mark.parametrize("path", DAY_FILES, ids=os.path.basename)
+def test_env_incremental_count_matches_dict_scan(path, thresholds):
+    records = read_records(path)
+    env = FNThresholdEnv(path, thresholds, ceilings(thresholds))
+    rng = np.random.default_rng(0)
+
+    observation, _ = env.reset()
+    assert observation[-1] == scan_above_threshold(records, env.current_thresholds)
+    for step in range(200):
+        observation, _, _, _, _ = env.step(rng.uniform(-1, 2, len(thresholds)).astype(np.float32))
+        expected = scan_above_threshold(records, env.current_thresholds)
+        assert env._calculate_fn_count() == expected
+        assert env._full_fn_count() == expected
+        assert observation[-1] == expected
+        if step % 50 == 49:
+            env.reset()
+
+
+@pytest.mark.parametrize("path", DAY_FILES, ids=os.path.basename)
+def test_sweep_count_matches_count_fns(path, thresholds):
+    eggs = load_eggs(path)
+    max_thresholds = ceilings(thresholds)
+    solved, fn_count = solve_thresholds(eggs, thresholds, max_thresholds, daily_cap=DAILY_CAP)
+
+    assert fn_count == count_fns(eggs, solved)
+    assert fn_count == scan_fns(read_records(path), solved)
+    assert fn_count <= count_fns(eggs, thresholds)
+    for label, value in solved.items():
+        assert thresholds[label] <= value <= min(max_thresholds[label], thresholds[label] + DAILY_CAP + 1e-9)
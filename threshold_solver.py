@@ -0,0 +1,62 @@
+import numpy as np
+
+from egg_index import window_bounds
+from egg_store import count_fns, fn_mask, load_eggs
+from label_registry import compile_profile
+
+# ✅ Thresholds are stored with 2 decimals by the day loop
+GRID = 0.01
+
+
+def _window_counts(sorted_values, candidates, percentage):
+    # ✅ Per candidate threshold: eggs with 0 < deviation <= percentage (values sorted ascending)
+    lower, upper = window_bounds(sorted_values, candidates, percentage)
+    return upper - lower
+
+
+def _candidate_thresholds(values, low, high, percentage):
+    # ✅ FN count only changes where the threshold crosses v or v / (1 + p), snapped to the grid
+    breakpoints = np.concatenate([values, values / (1 + percentage / 100)])
+    breakpoints = breakpoints[(breakpoints >= low) & (breakpoints <= high)]
+    grid_points = np.ceil(np.round(breakpoints / GRID, 6)) * GRID
+    candidates = np.concatenate([[low, high], grid_points, grid_points + GRID])
+    candidates = np.round(candidates, 2)
+    return np.unique(candidates[(candidates >= low) & (candidates <= high)])
+
+
+def solve_thresholds(day_eggs, thresholds, max_thresholds, daily_cap=1.0, percentage=1.0, max_sweeps=10):
+    # ✅ Minimize the day's FN count with each threshold in [current, min(ceiling, current + cap)]
+    eggs = load_eggs(day_eggs)
+    profile = compile_profile(thresholds, max_thresholds, daily_cap)
+    lows = profile.thresholds
+    highs = np.round(np.minimum(profile.ceilings, profile.thresholds + profile.daily_caps), 2)
+    active = np.flatnonzero(highs > lows)
+
+    # ✅ Thresholds per label ID (inf = label not in the profile), starting from the current ones
+    solution = profile.vector.copy()
+    best_fn_count = count_fns(eggs, solution, percentage)
+
+    # ✅ Exact sweep per label with the others fixed, repeated until nothing improves
+    for _ in range(max_sweeps):
+        improved = False
+        for i in active:
+            label_id = profile.ids[i]
+            others = solution.copy()
+            others[label_id] = np.inf
+            fixed = fn_mask(eggs, others, percentage)
+            values = np.sort(eggs.values[~fixed, label_id].astype(np.float64))
+
+            candidates = _candidate_thresholds(values, lows[i], highs[i], percentage)
+            fn_counts = int(fixed.sum()) + _window_counts(values, candidates, percentage)
+
+            # ✅ Fewest FNs, then the smallest threshold (first in sorted order)
+            best = int(np.argmin(fn_counts))
+            if fn_counts[best] < best_fn_count:
+                solution[label_id] = float(candidates[best])
+                best_fn_count = int(fn_counts[best])
+                improved = True
+        if not improved:
+            break
+
+    # ✅ Report the same count extract_fns gives for the returned thresholds
+    return profile.to_dict(solution[profile.ids]), count_fns(eggs, solution, percentage)
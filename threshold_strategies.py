@@ -0,0 +1,66 @@
+import numpy as np
+
+from egg_store import load_eggs
+from label_registry import compile_profile
+
+# ✅ Fine grid of MaxDeviation strategies: 1% to 200% in 1% steps
+STRATEGY_GRID = np.round(np.arange(1, 201) / 100, 2)
+
+# ✅ Upper bound on strategies × (egg, label) pairs per broadcast chunk
+CHUNK_ELEMENTS = 4_000_000
+
+
+def max_deviation_sweep(eggs, thresholds, strategies=STRATEGY_GRID):
+    # ✅ Accepted 1% FNs per strategy and label when each egg's threshold is preset + MaxDeviation × strategy
+    eggs = load_eggs(eggs)
+    profile = compile_profile(thresholds)
+    labels = profile.labels
+    strategies = np.asarray(strategies, dtype=np.float64)
+    presets = profile.thresholds
+    values = eggs.values[:, profile.ids].astype(np.float64)
+    max_deviation = np.nan_to_num(eggs.max_deviation.astype(np.float64), nan=0.0)
+
+    # ✅ Only non-zero values count as FNs for a label, so sweep just those (egg, label) pairs
+    fn_eggs, fn_labels = np.nonzero(values > 0)
+    fn_values = values[fn_eggs, fn_labels]
+    total = np.bincount(fn_labels, minlength=len(labels))
+    accepted = np.zeros((len(strategies), len(labels)), dtype=np.int64)
+
+    chunk = max(1, CHUNK_ELEMENTS // max(1, len(strategies)))
+    for start in range(0, len(fn_values), chunk):
+        stop = start + chunk
+        pair_labels = fn_labels[start:stop]
+        adjusted = np.round(presets[pair_labels] + max_deviation[fn_eggs[start:stop]] * strategies[:, None], 2)
+        accepted_pairs = fn_values[start:stop] <= adjusted
+        for i in range(len(labels)):
+            accepted[:, i] += accepted_pairs[:, pair_labels == i].sum(axis=1)
+
+    # ✅ Largest adjusted threshold per strategy (what the explorer would set)
+    largest_deviation = max_deviation.max(initial=0.0)
+    adjusted_max = np.round(presets + largest_deviation * strategies[:, None], 2)
+    return accepted, total, adjusted_max
+
+
+def frequency_thresholds(fn_eggs, thresholds, step=0.05):
+    # ✅ try.py rule: raise each label by up to step × the share of FN eggs above its threshold
+    fn_eggs = load_eggs(fn_eggs)
+    profile = compile_profile(thresholds)
+    if not len(fn_eggs):
+        return dict(thresholds)
+    above = (fn_eggs.values[:, profile.ids] > profile.thresholds).sum(axis=0)
+    adjusted = dict(thresholds)
+    for label, count in zip(profile.labels, above.tolist()):
+        if count > 0:
+            adjusted[label] = round(thresholds[label] * (1 + (count / len(fn_eggs)) * step), 2)
+    return adjusted
+
+
+def max_deviation_thresholds(fn_eggs, thresholds, strategies=STRATEGY_GRID):
+    # ✅ exploration.py rule: per label, the adjusted threshold of the first strategy with the highest acceptance rate
+    accepted, total, adjusted_max = max_deviation_sweep(fn_eggs, thresholds, strategies)
+    best = (accepted / np.maximum(total, 1)).argmax(axis=0)
+    adjusted = dict(thresholds)
+    for i, label in enumerate(compile_profile(thresholds).labels):
+        if total[i]:
+            adjusted[label] = float(adjusted_max[best[i], i])
+    return adjusted
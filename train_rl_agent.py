@@ -1,53 +1,50 @@
 import streamlit as st
-import gymnasium as gym
-import numpy as np
-from stable_baselines3 import PPO
-from fn_rl_env import FNThresholdEnv  # Import our custom Gym environment
-# Initial thresholds
-thresholds = {
-   "Blood": 80,
-   "Yolk": 120,
-   "Feces": 130,
-   "Bruised": 20,
-   "OpenCrack": 20,
-   "Crack": 175,
-   "Wrinkle": 6500,
-   "Feather": 100,
-   "CalciumSpot": 100,
-   "Dust": 150,
-   "Group_Dirty": 20,
-   "Group_Damaged": 20,
-   "Group_ShellDeviation": 1000
-}
+from app_cache import cached_result, load_upload
+from calibration import propose_thresholds, train_model
+from label_registry import ceilings, preset_thresholds
+from policy_export import NumpyPolicy, export_policy
+# Initial thresholds (sorter presets for every label)
+thresholds = preset_thresholds()
+# Maximum thresholds (+20% ceiling, same as the calibration loop)
+max_thresholds = ceilings(thresholds)
+# Trained thresholds and the exported policy cached by (data hash, starting thresholds); torch is only loaded here
+@cached_result
+def cached_train(digest, start_thresholds, _fn_data):
+   start_thresholds = dict(start_thresholds)
+   model = train_model(_fn_data, start_thresholds, max_thresholds)
+   new_thresholds = propose_thresholds(model, _fn_data, start_thresholds, max_thresholds)
+   return new_thresholds, export_policy(model, list(start_thresholds))
 st.title("RL-Based False Negative Threshold Optimization")
 st.write("Upload FN JSONL file and let the RL model learn the best threshold values.")
+# Train a new policy, or apply an exported NumPy policy (.npz, no torch needed)
+mode = st.radio("Mode", ["Train new policy", "Apply saved policy"], horizontal=True)
+policy_file = st.file_uploader("Upload NumPy policy (.npz)", type="npz") if mode == "Apply saved policy" else None
 # File uploader
 uploaded_file = st.file_uploader("Upload FN JSONL File", type="jsonl")
 if uploaded_file is not None:
    try:
-       # Save the uploaded file
-       fn_file = "fn_data.jsonl"
-       with open(fn_file, "wb") as f:
-           f.write(uploaded_file.getbuffer())
+       # Parse the uploaded file (cached by content hash)
+       digest, fn_data = load_upload(uploaded_file)
        st.success("FN file uploaded successfully!")
-       # ✅ Create Gym environment
-       env = FNThresholdEnv(fn_file, thresholds)
-       # ✅ Train RL agent
-       model = PPO("MlpPolicy", env, verbose=1)
-       model.learn(total_timesteps=5000)
-       # ✅ Get optimized thresholds
-       obs, _ = env.reset()
-       for _ in range(10):  # Let the model adjust 10 times
-           action, _ = model.predict(obs)
-           # ✅ FIX: Handle the 5-return values correctly
-           obs, reward, terminated, truncated, info = env.step(action)
-           # ✅ If the episode is terminated, reset the environment
-           if terminated or truncated:
-               obs, _ = env.reset()
-       # ✅ Extract new thresholds
-       new_thresholds = {key: obs[i] for i, key in enumerate(thresholds.keys())}
+       if mode == "Train new policy":
+           # ✅ Train RL agent on our custom Gym environment and let it adjust 10 times
+           new_thresholds, policy_bytes = cached_train(digest, tuple(thresholds.items()), fn_data)
+           st.download_button("Download trained policy (.npz)", policy_bytes, file_name="policy.npz")
+       elif policy_file is None:
+           st.info("Upload a policy exported with policy_export.py (or a day_XX.npz from the model registry).")
+           st.stop()
+       else:
+           # ✅ Let the saved policy adjust 10 times (NumPy forward pass), starting from the presets of its own labels
+           #    (registry policies cover the calibrated labels only)
+           policy = NumpyPolicy(policy_file.getvalue())
+           policy_thresholds = preset_thresholds(policy.labels) if policy.labels else thresholds
+           n_inputs = policy.layers[0][0].shape[1] if policy.layers else policy.action_weight.shape[1]
+           if n_inputs != len(policy_thresholds) + 1:
+               st.error(f"This policy takes {n_inputs - 1} thresholds; export it with its --labels.")
+               st.stop()
+           new_thresholds = propose_thresholds(policy, fn_data, policy_thresholds, ceilings(policy_thresholds))
        # ✅ Display new thresholds
        st.subheader("Optimized Thresholds from RL Agent")
        st.json(new_thresholds)
    except Exception as e:
-       st.error(f"Error: {e}")
\ No newline at end of file
+       st.error(f"Error: {e}")
@@ -0,0 +1,60 @@
+from stable_baselines3.common.callbacks import BaseCallback
+
+# ✅ Env steps without a new lowest FN count before a run is stopped (one full rollout)
+PATIENCE = 2048
+
+# ✅ Env steps with every threshold pinned at its ceiling before a run is stopped
+CEILING_PATIENCE = 256
+
+# ✅ Env steps between checks whether the restart is still needed
+CANCEL_CHECK_STEPS = 256
+
+
+class EarlyStopping(BaseCallback):
+    # ✅ Stops model.learn on zero FNs, an FN plateau, thresholds pinned at the ceiling or a cancelled restart
+    #    The convergence checks run at the end of a rollout and the stop takes effect on the first step of the
+    #    next one, so every stopped run has trained on all the rollouts it collected (at least one update)
+    def __init__(self, patience=PATIENCE, ceiling_patience=CEILING_PATIENCE, should_cancel=None, verbose=0):
+        super().__init__(verbose)
+        self.patience = patience
+        self.ceiling_patience = ceiling_patience
+        self.should_cancel = should_cancel
+        self.best_fn_count = None
+        self.steps_since_best = 0
+        self.steps_at_ceiling = 0
+        self.longest_at_ceiling = 0
+        self.stop_reason = None
+        self._converged = None
+
+    def _on_rollout_start(self):
+        self.longest_at_ceiling = self.steps_at_ceiling
+
+    def _on_step(self):
+        if self._converged:
+            self.stop_reason = self._converged
+            return False
+
+        infos = self.locals["infos"]
+        fn_count = min(info["fn_count"] for info in infos)
+        if self.best_fn_count is None or fn_count < self.best_fn_count:
+            self.best_fn_count = fn_count
+            self.steps_since_best = 0
+        else:
+            self.steps_since_best += len(infos)
+        self.steps_at_ceiling = self.steps_at_ceiling + len(infos) if all(info["at_ceiling"] for info in infos) else 0
+        self.longest_at_ceiling = max(self.longest_at_ceiling, self.steps_at_ceiling)
+
+        # ✅ A cancelled restart can't win, so it stops right away (its result is discarded)
+        if self.should_cancel is not None and self.n_calls % CANCEL_CHECK_STEPS == 0 and self.should_cancel():
+            self.stop_reason = "cancelled"
+            return False
+        return True
+
+    def _on_rollout_end(self):
+        # ✅ SB3 ignores this return value and trains on the rollout next; the stop is applied in _on_step
+        if self.patience is not None and self.best_fn_count == 0:
+            self._converged = "zero_fn"
+        elif self.patience is not None and self.steps_since_best >= self.patience:
+            self._converged = "plateau"
+        elif self.ceiling_patience is not None and self.longest_at_ceiling >= self.ceiling_patience:
+            self._converged = "ceiling"
@@ -1,21 +1,10 @@
-import json
 import streamlit as st
+from app_cache import load_upload
+from egg_index import evaluate_candidates
+from label_registry import preset_thresholds
+from threshold_strategies import frequency_thresholds
 # Initial preset thresholds
-thresholds = {
-   "Blood": 80,
-   "Yolk": 120,
-   "Feces": 130,
-   "Bruised": 20,
-   "OpenCrack": 20,
-   "Crack": 175,
-   "Wrinkle": 6500,
-   "Feather": 100,
-   "CalciumSpot": 100,
-   "Dust": 150,
-   "Group_Dirty": 20,
-   "Group_Damaged": 20,
-   "Group_ShellDeviation": 1000
-}
+thresholds = preset_thresholds()
 # Streamlit UI
 st.title("False Negative Learning Agent")
 st.write("Upload a False Negative JSONL file, and the agent will suggest new thresholds.")
@@ -23,31 +12,20 @@ st.write("Upload a False Negative JSONL file, and the agent will suggest new thr
 uploaded_file = st.file_uploader("Upload FN JSONL File", type="jsonl")
 if uploaded_file is not None:
    try:
-       # Read the FN file
-       data = []
-       with uploaded_file as file:
-           for line in file:
-               egg = json.loads(line)
-               data.append(egg)
-       if not data:
+       # Read the FN file into the eggs × labels matrix
+       _, data = load_upload(uploaded_file)
+       if not len(data):
            st.error("The uploaded file is empty or not in the expected format.")
        else:
            st.success(f"Loaded {len(data)} FN eggs.")
-           # Step 1: Analyze the FNs and Identify Labels Causing Most Issues
-           label_adjustments = {key: 0 for key in thresholds.keys()}
-           for egg in data:
-               for label, value in egg.items():
-                   if label in thresholds and value > thresholds[label]:
-                       label_adjustments[label] += 1  # Count how many times each label is above threshold
-           # Step 2: Adjust Thresholds Based on Frequency of FNs
-           adjusted_thresholds = thresholds.copy()
-           for label, count in label_adjustments.items():
-               if count > 0:  # If a label caused FNs, increase the threshold slightly
-                   increase_factor = 1 + (count / len(data)) * 0.05  # Increase threshold based on FN frequency
-                   adjusted_thresholds[label] = round(thresholds[label] * increase_factor, 2)
+           # Step 1 + 2: Raise each label's threshold by up to 5% of the share of FN eggs above it
+           adjusted_thresholds = frequency_thresholds(data, thresholds)
            # Step 3: Display Adjusted Thresholds
            st.subheader("Adjusted Thresholds Based on FN Data")
            st.json(adjusted_thresholds)
+           # Step 4: 1% FNs left at the preset and at the adjusted thresholds (both scored in one pass)
+           preset_fns, adjusted_fns = evaluate_candidates(data, [thresholds, adjusted_thresholds]).tolist()
+           st.write(f"1% FNs at preset thresholds: {preset_fns}, at adjusted thresholds: {adjusted_fns}")
            st.write("The model has suggested new threshold values to reduce False Negatives.")
    except Exception as e:
        st.error(f"An error occurred: {e}")
\ No newline at end of file